@@ -0,0 +1,1832 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description: The educational aestimo calculator for conduction band
+              calculations as a module. Importing it runs nothing; a
+              calculation is
+
+                  model = aestimo.StructureFrom(inputfile,database)
+                  result = aestimo.Poisson_Schrodinger(model)
+                  aestimo.save_and_plot(result,model)
+
+              StructureFrom takes an input file module (or a dict with the
+              same names), Structure takes the parameters directly.
+              Poisson_Schrodinger returns a Results object held in memory;
+              the solver settings default to config.py and can be changed
+              with a Settings object, e.g. Settings(eigensolver='matrix').
+              aestimo-edu.py is the script that runs config.inputfilename.
+"""
+import copy
+import time
+import hashlib
+import atexit
+import json
+import numpy as np
+import os
+import config,database
+# --------------------------------------
+import logging
+logger = logging.getLogger('aestimo')
+logger.addHandler(logging.NullHandler()) # the script (or the user) chooses where the log goes
+# --------------------------------------
+# Optional compiled kernels (numba), falls back to the python functions below.
+aestimo_numba = None
+
+def init_jit(jit):
+    """Selects the numba compiled kernels (loading or compiling them the
+    first time) if jit is True and numba is installed, otherwise the python
+    functions of this module."""
+    global aestimo_numba
+    if not jit:
+        aestimo_numba = None
+        return
+    if aestimo_numba is None:
+        try:
+            import aestimo_numba
+            aestimo_numba.warmup()
+            logger.info("Using numba compiled kernels")
+        except ImportError:
+            aestimo_numba = None
+
+# Optional scipy eigensolvers, imported when first used (scipy is slow to import).
+eigh_tridiagonal = sparse_diags = eigsh = None
+
+def init_scipy():
+    """Imports the scipy functions of the 'matrix' and 'sparse' eigensolvers
+    the first time. Returns False if scipy is not installed."""
+    global eigh_tridiagonal,sparse_diags,eigsh
+    if eigh_tridiagonal is None:
+        try:
+            from scipy.linalg import eigh_tridiagonal # for the 'matrix' eigensolver
+            from scipy.sparse import diags as sparse_diags # for the 'sparse' eigensolver
+            from scipy.sparse.linalg import eigsh
+        except ImportError:
+            return False
+    return True
+# --------------------------------------
+
+#Defining constants and material parameters
+q = 1.602176e-19 #C
+kb = 1.3806504e-23 #J/K
+nii = 0.0
+hbar = 1.054588757e-34
+m_e= 9.1093826E-31 #kg
+pi=np.pi
+eps0= 8.8541878176e-12 #F/m
+
+J2meV=1e3/q #Joules to meV
+meV2J=1e-3*q #meV to Joules
+
+class Settings():
+    """Solver settings, by default the values in config.py (read when the
+    object is made). Keyword arguments override them, e.g.
+    Settings(eigensolver='matrix',messagesoff=True). See config.py for the
+    meaning of each setting."""
+    names = ('eigensolver','delta_E','d_E','shooting_batch','bracketing','warmstart',
+             'warmstart_window','E_start','Estate_convergence_test','FD_convergence_test',
+             'jit','poisson_update','damping','mixing','mixing_history','max_iterations',
+             'convergence_test','messagesoff','auto_subbands','subband_cutoff','max_subbands')
+
+    def __init__(self,**kwargs):
+        for key in self.names:
+            setattr(self,key,getattr(config,key))
+        for key,value in kwargs.items():
+            if key not in self.names:
+                raise TypeError("unknown setting %s" %key)
+            setattr(self,key,value)
+
+class AttrDict(dict):
+    """turns a dictionary into an object with attribute style lookups"""
+    def __init__(self,*args,**kwargs):
+        dict.__init__(self,*args,**kwargs)
+        self.__dict__ = self
+
+def round2int(x):
+    """int is sensitive to floating point numerical errors near whole numbers,
+    this moves the discontinuity to the half interval. It is also equivalent
+    to the normal rules for rounding positive numbers."""
+    # int(x + (x>0) -0.5) # round2int for positive and negative numbers
+    return int(x+0.5)
+
+def point_widths(dxs):
+    """Width (m) of each grid point, half the spacing on either side (the
+    first point takes its spacing to the right): the weight of the point in
+    the normalisation of the wavefunctions and in the sheet charges"""
+    return np.concatenate((dxs[:1],(dxs[:-1]+dxs[1:])/2.0))
+
+#Vegard's law for alloys
+def vegard(first,second,mole):
+    return first*mole+second*(1-mole)
+
+class Structure():
+    """The structure to be simulated, rasterized on its grid.
+    material - list of layers: [thickness (nm), material, alloy fraction,
+        doping (cm**-3), 'n' or 'p'] and optionally the layer's grid
+        spacing (nm) as a sixth value
+    T - temperature (K), or a list of temperatures for a temperature sweep
+    Fapp - applied field (V/m)
+    subnumber_e - number of subbands to look for (the starting number with
+        config.auto_subbands)
+    comp_scheme - computation scheme: 0 (Schrodinger) or 2 (Schrodinger-Poisson)
+    dx - grid step size (m)
+    maxgridpoints - largest number of grid points allowed
+    mesh - 'uniform' or 'auto' (see build_mesh), with mesh_coarse (m) and
+        mesh_ratio for the 'auto' grid
+    database - module (or object) with the materialproperty and
+        alloyproperty dicts
+    The grid and the material arrays are then
+        n_max - number of grid points
+        dxs - grid spacing (m) between points i and i+1 (array, len n_max)
+        w - width of each point (m), (dxs[i-1]+dxs[i])/2, as in wf
+        xaxis - position of the points (m)
+        layer_ranges - (startindex,finishindex) of each layer
+        cb_meff - conduction band effective mass (kg) (array, len n_max)
+        fi - bandstructure potential (J) (array, len n_max)
+        eps - dielectric constant (including eps0) (array, len n_max)
+        dop - doping distribution (m**-3) (array, len n_max)"""
+    def __init__(self,material,T,Fapp,subnumber_e,comp_scheme,dx,maxgridpoints,
+                 mesh='uniform',mesh_coarse=1e-9,mesh_ratio=1.05,database=database):
+        self.material = [list(layer) for layer in material]
+        self.T = T
+        self.Fapp = Fapp
+        self.subnumber_e = subnumber_e
+        self.comp_scheme = comp_scheme
+        self.dx = dx
+        self.maxgridpoints = maxgridpoints
+        self.mesh = mesh
+        self.mesh_coarse = mesh_coarse
+        self.mesh_ratio = mesh_ratio
+        self.material_property = database.materialproperty
+        self.alloy_property = database.alloyproperty
+
+        if comp_scheme in (1,3):
+            logger.error("aestimo doesn't yet include non-parabolicity calculations - try aestimo_numpy instead")
+            raise ValueError("aestimo doesn't yet include non-parabolicity calculations - try aestimo_numpy instead")
+        if comp_scheme in (4,5,6):
+            logger.error("aestimo doesn't yet include the exchange interaction calculations - try aestimo_numpy instead")
+            raise ValueError("aestimo doesn't yet include the exchange interaction calculations - try aestimo_numpy instead")
+        self.create_structure_arrays()
+
+    def layer_properties(self,layer):
+        """Material parameters of a layer, looked up once for all its grid points:
+        (effective mass (kg), conduction band edge (Joules), dielectric constant
+        (F/m), ionised dopant charge density (m**-3))"""
+        matType = layer[1]
+        if matType in self.material_property:
+            matprops = self.material_property[matType]
+            meff = matprops['m_e']*m_e
+            edge = matprops['Band_offset']*matprops['Eg']*q #Joule
+            epsilon = matprops['epsilonStatic']*eps0
+        else:
+            alloyprops = self.alloy_property[matType]
+            mat1 = self.material_property[alloyprops['Material1']]
+            mat2 = self.material_property[alloyprops['Material2']]
+            x = layer[2] #alloy ratio
+            meff = vegard(mat1['m_e'],mat2['m_e'],x)*m_e
+            edge = alloyprops['Band_offset']*(vegard(mat1['Eg'],mat2['Eg'],x)-alloyprops['Bowing_param']*x*(1-x))*q # for electron. Joule
+            epsilon = vegard(mat1['epsilonStatic'],mat2['epsilonStatic'],x)*eps0
+        if layer[4] == 'n':
+            chargedensity = -layer[3]*1e6 #charge density in m**-3 (conversion from cm**-3)
+        elif layer[4] == 'p':
+            chargedensity = layer[3]*1e6 #charge density in m**-3 (conversion from cm**-3)
+        else:
+            chargedensity = 0.0
+        return meff,edge,epsilon,chargedensity
+
+    def graded_spacing(self,thickness,refine_left,refine_right):
+        """Grid spacings (m) for a layer: dx at the refined interfaces, growing by
+        mesh_ratio per point away from them up to mesh_coarse, scaled to fill
+        the layer exactly."""
+        dx = self.dx
+        if not(refine_left or refine_right):
+            n = max(1,round2int(thickness/self.mesh_coarse))
+            return [thickness/n]*n
+        x_max = sum([layer[0] for layer in self.material])*1e-9 #total thickness (m)
+        steps = []
+        position = 0.0
+        while thickness - position > 0.5*dx:
+            distance = min(position if refine_left else x_max, thickness-position if refine_right else x_max)
+            step = min(self.mesh_coarse,dx+(self.mesh_ratio-1.0)*distance,thickness-position)
+            steps.append(step)
+            position += step
+        return [step*thickness/position for step in steps]
+
+    def build_mesh(self):
+        """Sets up the grid. Returns the grid spacing dxs[i] between points i and
+        i+1 (the last point is followed by the end of the structure) and the
+        (startindex,finishindex) of each layer.
+        mesh = 'uniform' gives the single spacing dx (gridfactor) everywhere.
+        mesh = 'auto' keeps dx in wells, in doped layers and next to the
+        interfaces, and lets it grow towards mesh_coarse inside undoped barriers.
+        A sixth value in a layer's row sets that layer's spacing (nm) explicitly."""
+        dx = self.dx
+        material = self.material
+        dxs = []
+        layer_ranges = []
+        position = 0.0 # metres
+        edges = [self.layer_properties(layer)[1] for layer in material]
+        for k,layer in enumerate(material):
+            thickness = layer[0]*1e-9
+            barrier = edges[k] > min(edges) # the wavefunctions decay in it
+            if len(layer) > 5 and layer[5]: # explicit spacing for this layer
+                n = max(1,round2int(thickness/(layer[5]*1e-9)))
+                steps = [thickness/n]*n
+            elif self.mesh == 'auto' and layer[3] == 0 and barrier:
+                steps = self.graded_spacing(thickness,k > 0,k < len(material)-1)
+            elif self.mesh == 'auto':
+                n = max(1,round2int(thickness/dx))
+                steps = [thickness/n]*n
+            else: # uniform, the layers are rasterized onto one dx grid
+                startindex = round2int(position/dx)
+                finishindex = round2int((position+thickness)/dx)
+                steps = [dx]*(finishindex-startindex)
+            position += thickness
+            layer_ranges.append((len(dxs),len(dxs)+len(steps)))
+            dxs.extend(steps)
+        return np.array(dxs),layer_ranges
+
+    def create_structure_arrays(self):
+        """Builds the grid and allocates and fills the material arrays"""
+        self.dxs,self.layer_ranges = self.build_mesh() #grid spacing (m) and layer index ranges
+        self.n_max = n_max = len(self.dxs)
+        self.xaxis = np.concatenate(([0.0],np.cumsum(self.dxs[:-1])))   #metres
+        self.w = point_widths(self.dxs)
+        if self.mesh != 'uniform':
+            logger.info("Non-uniform grid: %d points, spacing %g - %g nm" %(n_max,min(self.dxs)*1e9,max(self.dxs)*1e9))
+        if n_max > self.maxgridpoints:
+            logger.error("Grid number is exceeding the max number of %d" %self.maxgridpoints)
+            raise ValueError("Grid number is exceeding the max number of %d" %self.maxgridpoints)
+        self.cb_meff = np.zeros(n_max)	#conduction band effective mass
+        self.fi = np.zeros(n_max)	#Bandstructure potential
+        self.eps = np.zeros(n_max)	#dielectric constant
+        self.dop = np.zeros(n_max)	#doping distribution
+        self.fill_structure_lists()
+
+    def fill_structure_lists(self):
+        # initialise arrays/lists for structure, one fill per layer
+        counts = [finishindex-startindex for startindex,finishindex in self.layer_ranges]
+        props = np.array([self.layer_properties(layer) for layer in self.material])
+        self.cb_meff[:] = np.repeat(props[:,0],counts)
+        self.fi[:] = np.repeat(props[:,1],counts)
+        self.eps[:] = np.repeat(props[:,2],counts)
+        self.dop[:] = np.repeat(props[:,3],counts)
+
+    def copy(self):
+        """A copy of the structure with arrays of its own, e.g. to be changed
+        with update_layer (the database is shared)"""
+        model = copy.copy(self)
+        model.material = [list(layer) for layer in self.material]
+        model.layer_ranges = list(self.layer_ranges)
+        for name in ('dxs','w','xaxis','cb_meff','fi','eps','dop'):
+            setattr(model,name,getattr(self,name).copy())
+        return model
+
+    def fingerprint(self,**extra):
+        """Hash (hex string) of what a solution of the structure depends on: the
+        grid and material arrays (so only the database values of the materials
+        in use count), T, Fapp, subnumber_e and comp_scheme, together with the
+        extra values given (which must be json serializable), e.g. settings."""
+        h = hashlib.sha256()
+        params = dict(extra,T=[float(T) for T in np.atleast_1d(self.T)],Fapp=float(self.Fapp),
+                      subnumber_e=int(self.subnumber_e),comp_scheme=int(self.comp_scheme))
+        h.update(json.dumps(params,sort_keys=True).encode())
+        for array in (self.dxs,self.fi,self.cb_meff,self.eps,self.dop):
+            h.update(np.ascontiguousarray(array,dtype=float).tobytes())
+        return h.hexdigest()
+
+    def update_layer(self,k,layer):
+        """Replaces layer k of the structure (a row of the material list) and
+        re-rasterizes only the grid points that changed, e.g. for a sweep over
+        the doping, alloy fraction or thickness of one layer.
+        Returns the (startindex,finishindex) span of the grid that changed. If the
+        number of grid points changes (a new thickness), the grid is rebuilt,
+        the arrays are reallocated and the span runs to the end of the grid."""
+        self.material[k] = list(layer)
+        new_dxs,new_ranges = self.build_mesh()
+        if len(new_dxs) != self.n_max:
+            m = min(self.n_max,len(new_dxs))
+            changed = np.nonzero(new_dxs[:m] != self.dxs[:m])[0]
+            startindex = min(new_ranges[k][0],changed[0]) if len(changed) else new_ranges[k][0]
+            self.create_structure_arrays()
+            return startindex,self.n_max
+        # the layer itself, and any spacing that moved with it (auto mesh)
+        changed = np.nonzero(new_dxs != self.dxs)[0]
+        startindex,finishindex = new_ranges[k]
+        if len(changed):
+            startindex,finishindex = min(startindex,changed[0]),max(finishindex,changed[-1]+1)
+        self.dxs[:] = new_dxs
+        self.layer_ranges = new_ranges
+        self.xaxis[:] = np.concatenate(([0.0],np.cumsum(self.dxs[:-1])))
+        self.w[:] = point_widths(self.dxs)
+        for j,(start,finish) in enumerate(self.layer_ranges):
+            if start < finishindex and finish > startindex:
+                meff,edge,epsilon,chargedensity = self.layer_properties(self.material[j])
+                start,finish = max(start,startindex),min(finish,finishindex)
+                self.cb_meff[start:finish] = meff
+                self.fi[start:finish] = edge
+                self.eps[start:finish] = epsilon
+                self.dop[start:finish] = chargedensity
+        return startindex,finishindex
+
+class StructureFrom(Structure):
+    # the values of an input file that are read (mesh, mesh_coarse and mesh_ratio are optional)
+    names = ('material','T','Fapplied','subnumber_e','computation_scheme','gridfactor','maxgridpoints',
+             'mesh','mesh_coarse','mesh_ratio')
+
+    def __init__(self,inputfile,database=database):
+        """The Structure described by an input file (a module such as
+        sample-qw-qwdope.py, or a dict with the same names)"""
+        if isinstance(inputfile,dict):
+            inputfile = AttrDict(inputfile)
+        Structure.__init__(self,
+            material = inputfile.material,
+            T = inputfile.T,
+            Fapp = inputfile.Fapplied,
+            subnumber_e = inputfile.subnumber_e,
+            comp_scheme = inputfile.computation_scheme,
+            dx = inputfile.gridfactor*1e-9, #grid in m
+            maxgridpoints = inputfile.maxgridpoints,
+            # Non-uniform grid (optional)
+            mesh = getattr(inputfile,'mesh','uniform'), #'uniform' or 'auto'
+            mesh_coarse = getattr(inputfile,'mesh_coarse',1.0)*1e-9, #largest grid spacing in undoped bulk layers (m)
+            mesh_ratio = getattr(inputfile,'mesh_ratio',1.05), #growth of the grid spacing from one point to the next
+            database = database)
+
+# This function returns the value of the wavefunction (psi)
+# at +infinity for a given value of the energy.  The solution
+# to the energy occurs for psi(+infinity)=0.
+
+# FUNCTIONS for SHOOTING ------------------
+
+# calls of the shooting functions and Newton steps of calc_E_state (per level, of
+#its last call), read and reset by Poisson_Schrodinger for its timing report
+counters = {'psi_at_inf':0,'psi_at_inf_batch':0,'psi_at_inf_batch_energies':0,'newton_steps':[]}
+
+def reset_counters():
+    counters.update(psi_at_inf=0,psi_at_inf_batch=0,psi_at_inf_batch_energies=0,newton_steps=[])
+
+def psi_at_inf(E,fis,cb_meff,n_max,dx):
+    """Shooting method for heterostructure as given in Harrison's book
+    (on a grid with spacing dx[j] between points j and j+1)"""
+    counters['psi_at_inf'] += 1
+    if aestimo_numba:
+        return aestimo_numba.psi_at_inf(E,np.asarray(fis,dtype=float),np.asarray(cb_meff,dtype=float),n_max,np.asarray(dx,dtype=float))
+    # boundary conditions
+    # Omnibus ex nihilo ducendis sufficit unum - Gottfried Wilhelm Leibniz, 1697.
+    psi0 = 0.0
+    psi1 = 1.0
+    psi2 = None
+    for j in range(1,n_max-1,1): # Last potential not used
+        c0=(dx[j-1]+dx[j])/hbar**2
+        c1=2.0/(cb_meff[j]+cb_meff[j-1])/dx[j-1]
+        c2=2.0/(cb_meff[j]+cb_meff[j+1])/dx[j]
+        psi2=((c0*(fis[j]-E)+c2+c1)*psi1-c1*psi0)/c2
+        psi0=psi1
+        psi1=psi2
+    return psi2
+
+def psi_at_inf_batch(energies,fis,cb_meff,n_max,dx):
+    """psi_at_inf for a vector of energies, marched through the grid in lockstep.
+    All the solutions share one scale factor, which is reduced whenever they
+    grow large, so the results are proportional to psi_at_inf (same sign,
+    same ratios between energies) but not equal to it."""
+    E = np.asarray(energies,dtype=float)
+    counters['psi_at_inf_batch'] += 1
+    counters['psi_at_inf_batch_energies'] += len(E)
+    fis = np.asarray(fis,dtype=float)
+    cb_meff = np.asarray(cb_meff,dtype=float)
+    dx = np.asarray(dx,dtype=float)
+    if aestimo_numba:
+        return aestimo_numba.psi_at_inf_batch(E,fis,cb_meff,n_max,dx)
+    c0 = (dx[:-2]+dx[1:-1])/hbar**2
+    c = 2.0/(cb_meff[1:]+cb_meff[:-1])/dx[:-1] # c1,c2 coupling between points j and j+1
+    # psi2 = (a[j] - g[j]*E)*psi1 - c1[j]*psi0, i.e. the psi_at_inf step divided by c2
+    a = ((c0*fis[1:-1]+c[1:]+c[:-1])/c[1:]).tolist()
+    g = (c0/c[1:]).tolist()
+    c1 = (c[:-1]/c[1:]).tolist()
+    psi0 = np.zeros_like(E)
+    psi1 = np.ones_like(E)
+    psi2 = np.empty_like(E)
+    for j in range(0,n_max-2,1):
+        np.multiply(E,-g[j],out=psi2)
+        psi2 += a[j]
+        psi2 *= psi1
+        psi2 -= c1[j]*psi0
+        psi0,psi1,psi2 = psi1,psi2,psi0
+        if j%32 == 0:
+            big = max(abs(psi1))
+            if big > 1e150:
+                psi0 /= big
+                psi1 /= big
+    return psi1
+
+def scan_E_brackets(numlevels,fi,model,energyx0,settings):
+    """Steps the energy up from energyx0 in delta_E steps, like the scan in
+    calc_E_state, but evaluates shooting_batch energies per psi_at_inf_batch
+    call. Returns (energy just above the root, bracket width, psi below, psi
+    above) for each of the first numlevels sign changes of psi(+infinity)."""
+    delta_E = settings.delta_E
+    brackets = []
+    energyx = energyx0
+    while len(brackets) < numlevels:
+        energies = energyx + delta_E*np.arange(settings.shooting_batch)
+        y = psi_at_inf_batch(energies,fi,model.cb_meff,model.n_max,model.dxs)
+        for k in np.nonzero(y[:-1]*y[1:] < 0)[0]:
+            brackets.append((float(energies[k+1]),delta_E,float(y[k]),float(y[k+1])))
+        energyx = energies[-1] # the next batch starts from the last energy
+    return brackets[:numlevels]
+
+def bracket_E_states_guess(numlevels,fi,model,energyx0,E_guess,settings):
+    """Brackets each state in a window of +-warmstart_window around its
+    energy from a previous calculation (E_guess, meV), with one
+    psi_at_inf_batch call. Returns the brackets in the form used by
+    calc_E_state, or None when any window fails to hold a sign change of
+    psi(+infinity), or when the windows aren't the lowest states above
+    energyx0, one each (Sturm count), e.g. when a new state has come down
+    below them."""
+    if E_guess is None or len(E_guess) < numlevels:
+        return None
+    E = np.asarray(E_guess[:numlevels],dtype=float)*meV2J
+    lo = E - settings.warmstart_window
+    hi = E + settings.warmstart_window
+    if any(hi[:-1] >= lo[1:]): # overlapping windows can't tell the levels apart
+        return None
+    y = psi_at_inf_batch(np.concatenate((lo,hi)),fi,model.cb_meff,model.n_max,model.dxs)
+    if any(y[:numlevels]*y[numlevels:] >= 0.0):
+        return None
+    diag,offdiag = hamiltonian_tridiagonal(fi,model.cb_meff,model.dxs)
+    counts = sturm_count(np.concatenate(([energyx0],lo,hi)),diag,offdiag)
+    first,counts = counts[0],counts[1:]
+    if counts[0] != first or any(counts[numlevels:]-counts[:numlevels] != 1) or any(np.diff(counts[:numlevels]) != 1):
+        return None
+    return [(float(hi[i]),2.0*settings.warmstart_window,float(y[i]),float(y[numlevels+i])) for i in range(numlevels)]
+
+#nb. function was much slower when fi is a numpy array than a python list.
+def calc_E_state(numlevels,fi,model,energyx0,settings,E_guess=None,index=None,events=None): # delta_E,d_E
+    """Finds the Eigen-energies of any bound states of the chosen potential.
+    numlevels - number of levels to find
+    fi - Potential energy (Joules)
+    model - any object with attributes:
+        cb_meff - array of effective mass (len n_max)
+        n_max - length of arrays
+        dxs - step sizes (metres)
+    energyx0 - minimum energy for starting subband search (Joules)
+    settings - Settings (delta_E, d_E, Estate_convergence_test, bracketing,
+        shooting_batch, warmstart_window)
+    E_guess - energies (meV) from a previous calculation, e.g. the previous
+        Poisson iteration. Each level is then bracketed close to its guess and
+        the full search is only used if that fails.
+    index - if given (0 included), the levels are bracketed by their count
+        above energyx0 (bracket_E_states_sturm) whatever settings.bracketing,
+        after the warm start from E_guess if there is one, and the first
+        index levels are skipped.
+    events - Events told (DETAIL) when the warm start fails."""
+    delta_E = settings.delta_E
+    d_E = settings.d_E
+    if not (np.all(np.isfinite(fi)) and np.isfinite(energyx0)):
+        raise ValueError("the potential is not finite, no states can be found")
+    energyx=energyx0 #starting energy for subband search (Joules)
+    E_state=[0.0]*numlevels #Energies of subbands (meV)
+    n_max = model.n_max
+    dx = model.dxs
+    if aestimo_numba: # convert once rather than in every psi_at_inf call
+        fi = np.asarray(fi,dtype=float)
+        cb_meff = np.asarray(model.cb_meff,dtype=float)
+    else: # and the pure python loop is faster with lists
+        dx = model.dxs.tolist()
+        fi = np.asarray(fi,dtype=float).tolist()
+        cb_meff = np.asarray(model.cb_meff,dtype=float).tolist()
+    #fi - Potential energy (J)
+    #cb_meff - effective mass of electrons in conduction band (kg)
+    batch_scan = settings.shooting_batch > 1 and not aestimo_numba # compiled kernels scan fastest one energy at a time
+    if index is not None and E_guess is None:
+        brackets = bracket_E_states_sturm(numlevels,fi,model,energyx0,settings,index)
+    else:
+        brackets = bracket_E_states_guess(numlevels,fi,model,energyx0,E_guess,settings)
+    if brackets is None:
+        if E_guess is not None and events:
+            events.emit(DETAIL,'warmstart_failed',"Warm start failed, searching for the states from the potential minimum")
+        if settings.bracketing == 'sturm' or index is not None:
+            brackets = bracket_E_states_sturm(numlevels,fi,model,energyx0,settings,0 if index is None else index)
+        elif batch_scan:
+            brackets = scan_E_brackets(numlevels,fi,model,energyx0,settings)
+    newton_steps = counters['newton_steps'] = [0]*numlevels
+    for i in range(0,numlevels,1):
+        if brackets is not None:
+            energyx,width,y1,y2 = brackets[i]
+        else:
+            width = delta_E
+            #increment energy-search for f(x)=0
+            y2=psi_at_inf(energyx,fi,cb_meff,n_max,dx)
+            while True:
+                y1=y2
+                energyx += delta_E
+                y2=psi_at_inf(energyx,fi,cb_meff,n_max,dx)
+                if y1*y2 < 0:
+                    break
+                if not np.isfinite(y2): # no sign change can ever be found
+                    raise ValueError("psi(+infinity) is not finite at %g meV, the search for state %d failed" %(energyx*J2meV,i))
+        # improve estimate using midpoint rule
+        energyx -= abs(y2)/(abs(y1)+abs(y2))*width
+        #implement Newton-Raphson method
+        while True:
+            y = psi_at_inf(energyx,fi,cb_meff,n_max,dx)
+            dy = (psi_at_inf(energyx+d_E,fi,cb_meff,n_max,dx)- psi_at_inf(energyx-d_E,fi,cb_meff,n_max,dx))/(2.0*d_E)
+            energyx -= y/dy
+            newton_steps[i] += 1
+            if abs(y/dy) < settings.Estate_convergence_test:
+                break
+        E_state[i]=energyx*J2meV
+        # clears x from solution
+        energyx += delta_E # finish for i-th state.
+    return E_state
+
+# FUNCTIONS for MATRIX EIGENSOLVER and STURM SEQUENCE BRACKETING------------------
+def hamiltonian_tridiagonal(fis,cb_meff,dx):
+    """Finite difference Hamiltonian used by psi_at_inf written as a symmetric
+    tridiagonal matrix over the interior points 1..n_max-2 (psi is zero at
+    the first and last points, as in the shooting method).
+    On a non-uniform grid the equations are scaled by the square root of the
+    width of each point (dx[j-1]+dx[j])/2, which makes the matrix symmetric;
+    its eigenvectors are then the envelopes in wf's units.
+    Returns the diagonal and the off-diagonal (Joules)."""
+    fis = np.asarray(fis,dtype=float)
+    cb_meff = np.asarray(cb_meff,dtype=float)
+    dx = np.asarray(dx,dtype=float)
+    w = (dx[:-2]+dx[1:-1])/2.0 # width of the interior points
+    c = 2.0/(cb_meff[1:]+cb_meff[:-1])/dx[:-1] # c1,c2 coupling between points j and j+1
+    diag = fis[1:-1] + hbar**2/2.0*(c[:-1]+c[1:])/w
+    offdiag = -hbar**2/2.0*c[1:-1]/np.sqrt(w[:-1]*w[1:])
+    return diag,offdiag
+
+def sturm_count(energies,diag,offdiag):
+    """Number of eigenvalues of the tridiagonal Hamiltonian below each of the
+    energies (Sturm sequence: the number of negative pivots of H - E).
+    This equals the number of nodes of the shooting solution at that energy."""
+    E = np.asarray(energies,dtype=float)
+    if aestimo_numba:
+        return aestimo_numba.sturm_count(E,diag,offdiag)
+    d = diag.tolist()
+    e2 = (offdiag**2).tolist()
+    count = np.zeros(E.shape,dtype=int)
+    p = d[0] - E
+    count += p < 0.0
+    with np.errstate(divide='ignore'): # a zero pivot gives -inf, then the sequence carries on
+        for j in range(1,len(d),1):
+            p = (d[j] - E) - e2[j-1]/p
+            count += p < 0.0
+    return count
+
+def bracket_E_states_sturm(numlevels,fi,model,energyx0,settings,index=0):
+    """Brackets each of the first numlevels states above energyx0 (from the
+    index-th one) directly, using the eigenvalue count below an energy
+    (sturm_count). All brackets are
+    narrowed together by multisection, shooting_batch energies per sweep,
+    until each one is at most delta_E wide and holds exactly one state, so
+    close lying levels can not be skipped.
+    Returns the brackets in the form used by calc_E_state: (upper energy,
+    bracket width, psi at lower energy, psi at upper energy)"""
+    diag,offdiag = hamiltonian_tridiagonal(fi,model.cb_meff,model.dxs)
+    r = np.abs(offdiag)
+    E_top = max(diag + np.append(r,0.0) + np.append(0.0,r)) # Gershgorin bound of the spectrum
+    first = sturm_count([energyx0],diag,offdiag)[0] # number of states below energyx0
+    target = first + index + np.arange(numlevels) # number of states below state i
+    lo = np.full(numlevels,float(energyx0))
+    hi = np.full(numlevels,float(E_top))
+    count_lo = np.full(numlevels,first)
+    count_hi = np.full(numlevels,len(diag))
+    while True:
+        todo = (((hi-lo) > settings.delta_E) | (count_hi-count_lo > 1)) & ((hi-lo) > settings.Estate_convergence_test)
+        if not todo.any():
+            break
+        per = max(2,settings.shooting_batch//int(todo.sum())) # energies per bracket in this sweep
+        energies = lo[todo,None] + (hi-lo)[todo,None]*np.arange(1,per+1)/(per+1.0)
+        counts = sturm_count(energies.ravel(),diag,offdiag).reshape(energies.shape)
+        below = counts <= target[todo,None]
+        lo[todo] = np.where(below,energies,-np.inf).max(axis=1).clip(lo[todo])
+        hi[todo] = np.where(below,np.inf,energies).min(axis=1).clip(None,hi[todo])
+        count_lo[todo] = np.where(below,counts,-1).max(axis=1).clip(count_lo[todo])
+        count_hi[todo] = np.where(below,len(diag)+1,counts).min(axis=1).clip(None,count_hi[todo])
+    y = psi_at_inf_batch(np.concatenate((lo,hi)),fi,model.cb_meff,model.n_max,model.dxs)
+    return [(float(hi[i]),float(hi[i]-lo[i]),float(y[i]),float(y[numlevels+i])) for i in range(numlevels)]
+
+def calc_E_state_matrix(numlevels,fi,model,energyx0):
+    """Finds the lowest numlevels eigen-energies and envelope functions with a
+    single LAPACK call (?stebz bisection + ?stein inverse iteration for the
+    selected indices only) on the tridiagonal Hamiltonian.
+    numlevels - number of levels to find
+    fi - Potential energy (Joules)
+    energyx0 - minimum energy for the states (Joules)
+    Returns E_state (meV) and wfe normalised like wf (units dx**0.5)"""
+    diag,offdiag = hamiltonian_tridiagonal(fi,model.cb_meff,model.dxs)
+    first = sturm_count([energyx0],diag,offdiag)[0] # number of states below energyx0
+    E,psi = eigh_tridiagonal(diag,offdiag,select='i',select_range=(first,first+numlevels-1),
+                             lapack_driver='stebz')
+    return (E*J2meV).tolist(),wf_from_eigenvectors(psi,model.n_max)
+
+def calc_E_state_sparse(numlevels,fi,model,energyx0,wfe_guess=None):
+    """Finds the numlevels states just above energyx0 with shift-invert Lanczos
+    (ARPACK through scipy) on the sparse tridiagonal Hamiltonian. Only the
+    factorised matrix and a few Lanczos vectors are stored, so memory is
+    O(n_max*numlevels) and nothing can overflow in thick barriers.
+    wfe_guess - envelopes from a previous calculation, used as the starting
+        vector of the Lanczos iteration
+    Returns E_state (meV) and wfe normalised like wf (units dx**0.5)"""
+    diag,offdiag = hamiltonian_tridiagonal(fi,model.cb_meff,model.dxs)
+    H = sparse_diags([offdiag,diag,offdiag],[-1,0,1],format='csc')*J2meV # meV, keeps ARPACK well scaled
+    if wfe_guess is not None and len(wfe_guess) >= numlevels:
+        v0 = np.sum(wfe_guess[:numlevels],axis=0)[1:-1]
+    else:
+        v0 = np.ones(len(diag))
+    # in shift-invert mode 'LA' selects the eigenvalues closest above the shift
+    E,psi = eigsh(H,k=numlevels,sigma=energyx0*J2meV,which='LA',v0=v0,
+                  ncv=min(len(diag),2*numlevels+4)) # few Lanczos vectors, memory O(n_max*numlevels)
+    order = np.argsort(E)
+    return E[order].tolist(),wf_from_eigenvectors(psi[:,order],model.n_max)
+
+def wf_from_eigenvectors(psi,n_max):
+    """Envelope functions (units dx**0.5, like wf) from the eigenvectors of
+    the tridiagonal Hamiltonian (columns of psi, interior points only)."""
+    wfe = np.zeros((psi.shape[1],n_max),dtype = float)
+    wfe[:,1:-1] = psi.transpose()
+    for b in wfe:
+        b /= np.sqrt(np.sum(b**2))
+        # same sign convention as wf (psi[1] = 1.0), taken at the first
+        # point where the envelope is clear of round-off.
+        first = np.argmax(abs(b) > 1e-6*max(abs(b)))
+        if b[first] < 0.0:
+            b *= -1.0
+    return wfe
+
+# FUNCTIONS for ENVELOPE FUNCTION WAVEFUNCTION--------------------------------
+def wf(E,fis,model):
+    """This function returns the value of the wavefunction (psi)
+    at +infinity for a given value of the energy.  The solution
+    to the energy occurs for psi(+infinity)=0.
+    psi[3] wavefunction at z-delta_z, z and z+delta_z
+    i index
+
+    E - eigen-energy of state (Joules)
+    fis - Potential energy of system (Joules)
+    model - an object with atributes:
+        cb_meff - array of effective mass (len n_max)
+        n_max - length of arrays
+        dxs - step sizes (metres)
+    On a non-uniform grid b[j] is psi[j] times the square root of the width
+    of point j, so that sum(b**2) is still 1 and b**2 is the probability of
+    finding the electron at point j."""
+    n_max = model.n_max
+    if aestimo_numba:
+        return aestimo_numba.wf(E,np.asarray(fis,dtype=float),np.asarray(model.cb_meff,dtype=float),n_max,model.dxs)
+    dx = model.dxs.tolist()
+    fis = np.asarray(fis,dtype=float).tolist() # the python loop is faster with lists
+    cb_meff = np.asarray(model.cb_meff,dtype=float).tolist()
+    w = [dx[0]]+[(dx[j-1]+dx[j])/2.0 for j in range(1,n_max)] # width of each point
+    N = 0.0 # Normalization integral
+    psi = []
+    psi = [0.0]*3
+    # boundary conditions
+    psi[0] = 0.0
+    psi[1] = 1.0
+    b = [0.0]*n_max
+    b[0] = psi[0]
+    b[1] = psi[1]
+    N += (psi[0])**2*w[0]
+    N += (psi[1])**2*w[1]
+    for j in range(1,n_max-1,1):
+        # Last potential not used
+        c0=2.0*w[j]/hbar**2
+        c1=2.0/(cb_meff[j]+cb_meff[j-1])/dx[j-1]
+        c2=2.0/(cb_meff[j]+cb_meff[j+1])/dx[j]
+        psi[2] = ((c0*(fis[j]-E)+c2+c1)*psi[1]-c1*psi[0])/c2
+        b[j+1]=psi[2]
+        N += (psi[2])**2*w[j+1]
+        psi[0]=psi[1]
+        psi[1]=psi[2]
+    for j in range(0,n_max,1):
+        b[j]*=(w[j]/N)**0.5
+    return b # units of dx**0.5
+
+# FUNCTIONS for FERMI-DIRAC STATISTICS-----------------------------------------   
+def fd2(Ei,Ef,T):
+    """Integral of Fermi Dirac Equation for energy independent density of states,
+    kb*T*ln(1+exp((Ef-Ei)/(kb*T))) (Joules). Ei [meV], Ef [meV], T [K],
+    any of which may be arrays. Written with logaddexp, so it doesn't overflow
+    for deep levels or at low T; T = 0 gives the step function limit."""
+    kT = kb*np.asarray(T,dtype=float)
+    x = meV2J*(Ef-np.asarray(Ei,dtype=float))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        return np.where(kT > 0.0,kT*np.logaddexp(0.0,x/kT),np.maximum(x,0.0))
+
+def fd(Ei,Ef,T):
+    """Fermi Dirac occupation of the energy Ei, the derivative of fd2 with
+    respect to Ef (Joules). Ei [meV], Ef [meV], T [K]"""
+    kT = kb*np.asarray(T,dtype=float)
+    x = meV2J*(Ef-np.asarray(Ei,dtype=float))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        return np.where(kT > 0.0,0.5*(1.0+np.tanh(0.5*x/kT)),1.0*(x > 0.0))
+
+def calc_meff_state(wfe,cb_meff):
+    #find subband effective mass
+    return 1.0/np.einsum('ji,ji,i->j',wfe,wfe,1.0/cb_meff) #kg
+    
+def fermilevel_0K(Ntotal2d,E_state,meff_state,warn=True):
+    """Fermi level (meV) and populations of the levels (m**-2) at 0K, when
+    the -Ntotal2d electrons fill the lowest levels up to a common Ef. warn -
+    print a warning when all the levels are occupied."""
+    E = np.asarray(E_state,dtype=float)
+    g = np.asarray(meff_state,dtype=float)/(hbar**2*pi)*meV2J # density of states (m**-2 meV**-1)
+    order = np.argsort(E)
+    # Fermi level if the lowest k+1 levels are occupied, it is the one above level k
+    Efk = (-Ntotal2d + np.cumsum(g[order]*E[order]))/np.cumsum(g[order])
+    occupied = np.nonzero(Efk > E[order])[0]
+    k = occupied[-1] if len(occupied) else 0
+    Ef = Efk[k]
+    if k == len(E)-1 and warn:
+        print ("Have processed all energy levels present and so can't be sure that Ef is below next higher energy level.")
+        logger.warning("Have processed all energy levels present and so can't be sure that Ef is below next higher energy level.")
+    N_state = g*np.maximum(Ef-E,0.0) # populations of levels
+    return Ef,N_state #Fermi levels at 0K (meV), number of electrons in each subband at 0K
+    
+def fermilevel(Ntotal2d,T,E_state,meff_state,FD_convergence_test=1e-6,warn=True,max_steps=200):
+    """Fermi level (meV) that puts -Ntotal2d electrons in the levels E_state
+    (meV) with masses meff_state at the temperature T (K), to within
+    FD_convergence_test (meV). T may be an array of temperatures, which are
+    solved together (one Fermi level each).
+    Newton's method on the carrier balance, with its analytic derivative; the
+    root is kept bracketed and any step that leaves the bracket is replaced
+    by bisection, so it converges for any T and any depth of the levels.
+    warn - see fermilevel_0K.
+    max_steps - the Newton steps allowed, a warning is given (and the last
+        estimate returned) if some Fermi level has not converged by then."""
+    E = np.asarray(E_state,dtype=float)
+    g = np.asarray(meff_state,dtype=float)/(hbar**2*pi) # density of states (m**-2 J**-1)
+    Ef_0K,N_states_0K = fermilevel_0K(Ntotal2d,E,meff_state,warn)
+    Ts = np.atleast_1d(np.asarray(T,dtype=float))[:,np.newaxis]
+    def balance(Ef): # increases with Ef
+        return np.dot(fd2(E,Ef[:,np.newaxis],Ts),g) + Ntotal2d
+    # fd2 is larger than its T = 0 limit, so Ef is below Ef_0K
+    hi = np.full(len(Ts),Ef_0K)
+    width = kb*Ts[:,0]*J2meV
+    lo = hi - width
+    for i in range(100):
+        above = balance(lo) >= 0.0
+        if not above.any():
+            break
+        width[above] *= 2.0
+        lo = hi - width
+    Ef = hi.copy()
+    done = Ts[:,0] <= 0.0 # the 0K Fermi level is exact
+    for steps in range(max_steps):
+        if done.all():
+            break
+        y = balance(Ef)
+        hi = np.where(y > 0.0,Ef,hi)
+        lo = np.where(y > 0.0,lo,Ef)
+        dy = np.dot(fd(E,Ef[:,np.newaxis],Ts),g)*meV2J # d(balance)/d(Ef), Ef in meV
+        with np.errstate(divide='ignore',invalid='ignore'):
+            Ef_new = np.where(dy > 0.0,Ef - y/dy,lo)
+        bisect = ~((lo < Ef_new) & (Ef_new < hi))
+        Ef_new[bisect] = 0.5*(lo + hi)[bisect]
+        step = np.where(done,0.0,Ef_new - Ef)
+        Ef += step
+        done |= (abs(step) < FD_convergence_test) | (hi - lo < FD_convergence_test)
+    else:
+        if not done.all():
+            print ("Warning: the Fermi level has not converged in %d steps (T = %s K)" %(max_steps,Ts[~done,0]))
+            logger.warning("the Fermi level has not converged in %d steps (T = %s K)" %(max_steps,Ts[~done,0]))
+    if np.ndim(T) == 0:
+        return float(Ef[0]) #(meV)
+    return Ef #(meV)
+
+
+def calc_N_state(Ef,T,Ns,E_state,meff_state):
+    # Find the subband populations, taking advantage of step like d.o.s. and analytic integral of FD
+    # Ef and T may be arrays (a temperature sweep), giving one row of populations per temperature
+    Ef = np.asarray(Ef,dtype=float)[...,np.newaxis]
+    T = np.asarray(T,dtype=float)[...,np.newaxis]
+    return fd2(E_state,Ef,T)*np.asarray(meff_state,dtype=float)/(hbar**2*pi) # number of carriers in each subband
+    
+# FUNCTIONS for SELF-CONSISTENT POISSON--------------------------------
+
+def calc_sigma(wfe,N_state,model,out=None):
+    # This function calculates `net' areal charge density
+    # i index over z co-ordinates
+    # is index over states
+    # n-type dopants give -ve *(N+j) representing electrons, hence 
+    # addition of +ve ionised donors requires -*(Nda+i), note Nda is still a
+    # volume density, the delta_z converts it to an areal density
+    # out - array (len n_max) to write the result in, e.g. sigma
+    if out is None:
+        out = np.empty(model.n_max)
+    np.einsum('j,ji,ji->i',np.asarray(N_state,dtype=float),wfe,wfe,out=out) # sum_j N_state[j]*wfe[j]**2
+    out += model.dop*model.w
+    np.negative(out,out=out)
+    return out
+    
+##
+def calc_field(sigma,eps,out=None):
+    # F electric field as a function of z-
+    # Running integral of the charge density: eps[i]*F[i] = eps[i-1]*F[i-1] + q*(sigma[i-1]+sigma[i])/2
+    # out - array (len n_max) to write the result in, e.g. F
+    if out is None:
+        out = np.empty(len(sigma))
+    out[0] = 0.0
+    np.add(sigma[:-1],sigma[1:],out=out[1:])
+    np.cumsum(out,out=out)
+    # Do zeroth case explicitly - in fact, normally we can assume that the total electric field is zero (?)
+    # Note sigma is a number density per unit area, needs to be converted to Couloumb per unit area
+    out -= np.sum(sigma[1:])
+    out *= q/2.0
+    out /= eps
+    return out
+
+def calc_potn(F,model,out=None):
+    # This function calculates the potential (energy actually)
+    # V electric field as a function of z-
+    # i	index over z co-ordinates
+    # out - array (len n_max) to write the result in, e.g. V
+    
+    #Calculate the potential, defining the first point as zero
+    if out is None:
+        out = np.empty(model.n_max)
+    out[0] = 0.0
+    np.multiply(F[1:],model.dxs[:-1],out=out[1:]) #+q -> electron -q->hole? 
+    np.cumsum(out,out=out)
+    out *= q
+    return out
+
+def solve_tridiagonal(lower,diag,upper,rhs):
+    """Thomas algorithm for a tridiagonal system. lower[i] and upper[i] are the
+    coefficients of x[i-1] and x[i+1] in equation i; rhs is a list of right
+    hand sides, which are solved together."""
+    n = len(diag)
+    c = [0.0]*n
+    d = [[0.0]*n for r in rhs]
+    c[0] = upper[0]/diag[0]
+    for r,dr in zip(rhs,d):
+        dr[0] = r[0]/diag[0]
+    for i in range(1,n):
+        m = diag[i] - lower[i]*c[i-1]
+        c[i] = upper[i]/m
+        for r,dr in zip(rhs,d):
+            dr[i] = (r[i] - lower[i]*dr[i-1])/m
+    for dr in d:
+        for i in range(n-2,-1,-1):
+            dr[i] -= c[i]*dr[i+1]
+    return d
+
+def calc_potn_predictor(E_state,wfe,meff_state,E_F,V,T,model,convergence_test):
+    """Predictor step of the predictor-corrector scheme (Trellakis et al.,
+    J. Appl. Phys. 81, 7880 (1997)). The electron density follows the
+    potential as if each subband moved locally with it,
+        n(z) = sum_j |psi_j(z)|**2 * N_j(E_j + V'(z) - V(z), E_F'),
+    and the Poisson equation is solved for V' and E_F' (charge neutrality) by
+    Newton's method. V' is the potential of calc_sigma, calc_field and
+    calc_potn once the structure is neutral, so the self-consistent solution
+    is unchanged; the next Schrodinger solution is the corrector.
+    T - temperature (K); convergence_test - accuracy of V' (meV)
+    Returns None when the charge doesn't follow the potential (no electrons,
+    the Newton system is singular), the step isn't finite or Newton's
+    method doesn't converge; the caller then takes a fixed point step."""
+    n_max = model.n_max
+    eps = model.eps
+    P = np.asarray(wfe,dtype=float)**2
+    g = (np.asarray(meff_state,dtype=float)/(hbar**2*pi))[:,np.newaxis]*P # 2D density of states of each state at each point
+    E = np.asarray(E_state,dtype=float)[:,np.newaxis]*meV2J
+    sigma_dop = -model.dop*model.w
+    e_dx = eps[1:]/model.dxs[:-1] # eps[i]/dx[i-1] for i = 1..n_max-1
+    q2 = q**2
+    
+    def charge(Vp,Ef):
+        Ei = (E + (Vp - V))*J2meV # subbands shifted locally (meV)
+        sigma = sigma_dop - np.sum(g*fd2(Ei,Ef*J2meV,T),axis=0)
+        d = np.sum(g*fd(Ei,Ef*J2meV,T),axis=0) # d(sigma)/dV' = -d(sigma)/dE_F
+        return sigma,d
+    
+    def residual(Vp,sigma):
+        # Poisson equation with the discretisation of calc_field and calc_potn.
+        # qD[i-1] = q*eps[i]*F[i]; r[0]: field at the left end, r[-1]: at the right end
+        qD = e_dx*np.diff(Vp)
+        r = np.empty(n_max)
+        r[0] = qD[0] - q2*(2.0*sigma[0] + sigma[1])/2.0
+        r[1:-1] = qD[1:] - qD[:-1] - q2*(sigma[1:-1] + sigma[2:])/2.0
+        r[-1] = qD[-1] + q2*sigma[-1]/2.0
+        return r
+    
+    Vp = V.copy()
+    Ef = E_F*meV2J
+    sigma,d = charge(Vp,Ef)
+    if not d.any(): # no charge terms in the Jacobian
+        return None
+    r = residual(Vp,sigma)
+    for k in range(50):
+        # Jacobian: tridiagonal in V'[1:] for r[1:], with the E_F column and r[0] as border
+        lower = np.zeros(n_max-1)
+        lower[1:] = e_dx[1:]
+        lower[-1] = -e_dx[-1]
+        diag = np.empty(n_max-1)
+        diag[:-1] = -e_dx[1:] - e_dx[:-1] - q2*d[1:-1]/2.0
+        diag[-1] = e_dx[-1] + q2*d[-1]/2.0
+        upper = np.zeros(n_max-1)
+        upper[:-1] = e_dx[1:] - q2*d[2:]/2.0
+        col = np.empty(n_max-1)
+        col[:-1] = q2*(d[1:-1] + d[2:])/2.0
+        col[-1] = -q2*d[-1]/2.0
+        y1,y2 = solve_tridiagonal(lower.tolist(),diag.tolist(),upper.tolist(),[(-r[1:]).tolist(),col.tolist()])
+        c1 = e_dx[0] - q2*d[1]/2.0
+        dEf = (-r[0] - c1*y1[0])/(q2*(2.0*d[0] + d[1])/2.0 - c1*y2[0])
+        dV = np.zeros(n_max)
+        dV[1:] = np.array(y1) - np.array(y2)*dEf
+        if not (np.isfinite(dEf) and np.all(np.isfinite(dV))):
+            return None
+        # backtrack until the residual decreases
+        for l in range(30):
+            sigma_new,d_new = charge(Vp + dV,Ef + dEf)
+            r_new = residual(Vp + dV,sigma_new)
+            if max(abs(r_new)) < max(abs(r)):
+                break
+            dV *= 0.5
+            dEf *= 0.5
+        Vp += dV
+        Ef += dEf
+        sigma,d,r = sigma_new,d_new,r_new
+        if max(max(abs(dV)),abs(dEf)) < convergence_test*meV2J:
+            break
+    else: # no convergence in 50 Newton steps
+        return None
+    if not (np.isfinite(Ef) and np.all(np.isfinite(Vp))):
+        return None
+    return Vp
+
+def anderson_mix(V,Vnew,history,beta,mixing_history):
+    """Anderson/Pulay (DIIS) mixing of the potential. history is the list of
+    (V,Vnew-V) of the previous iterations, it is updated here. The next
+    potential is the combination of the previous ones that minimises the
+    residual Vnew-V (least squares), plus damping times that residual."""
+    V = np.array(V,dtype=float) # a copy, V is updated in place by the caller
+    R = Vnew - V
+    history.append((V,R)) # at most mixing_history+1 entries
+    if len(history) > mixing_history+1:
+        del history[0]
+    if len(history) == 1:
+        return V + beta*R
+    dV = np.array([history[k+1][0]-history[k][0] for k in range(len(history)-1)]).T
+    dR = np.array([history[k+1][1]-history[k][1] for k in range(len(history)-1)]).T
+    gamma = np.linalg.lstsq(dR,R,rcond=None)[0]
+    return V + beta*R - np.dot(dV + beta*dR,gamma)
+
+def adapt_subbands(E_state,wfe,meff_state,E_F,T,Ntotal2d,fi,model,energyx0,settings,eigensolver):
+    """Automatic number of subbands (settings.auto_subbands): the states are
+    kept in increasing order up to the first one more than subband_cutoff kT
+    above the Fermi level, the higher ones hold no charge to speak of. While
+    the highest state is below that (e.g. the states can't hold Ntotal2d
+    below it), the next one is found and E_F again (at most max_subbands
+    states); the states above the first empty one are dropped.
+    Returns E_state, wfe, meff_state and E_F."""
+    kT = kb*T*J2meV # meV
+    E_state = list(E_state)
+    while E_state[-1] < E_F + settings.subband_cutoff*kT and len(E_state) < settings.max_subbands:
+        if eigensolver == 'matrix':
+            E_state,wfe = calc_E_state_matrix(len(E_state)+1,fi,model,energyx0)
+        elif eigensolver == 'sparse':
+            E_state,wfe = calc_E_state_sparse(len(E_state)+1,fi,model,energyx0)
+        else: # only the new state, found by its count above energyx0 so that close levels aren't skipped
+            newton_steps = counters['newton_steps']
+            E = calc_E_state(1,fi,model,energyx0,settings,index=len(E_state))
+            counters['newton_steps'] = newton_steps+counters['newton_steps']
+            E_state += E
+            wfe = np.vstack((wfe,wf(E[0]*meV2J,fi,model)))
+        meff_state = calc_meff_state(wfe,model.cb_meff)
+        E_F = fermilevel(Ntotal2d,T,E_state,meff_state,settings.FD_convergence_test,warn=False)
+    if E_state[-1] < E_F + settings.subband_cutoff*kT:
+        print ("%d subbands (max_subbands) don't reach %g kT above the Fermi level" %(len(E_state),settings.subband_cutoff))
+        logger.warning("%d subbands (max_subbands) don't reach %g kT above the Fermi level" %(len(E_state),settings.subband_cutoff))
+    empty = [i for i,E in enumerate(E_state) if E > E_F + settings.subband_cutoff*kT]
+    if empty and empty[0] < len(E_state)-1:
+        n = empty[0]+1
+        E_state,wfe,meff_state = E_state[:n],wfe[:n].copy(),meff_state[:n]
+        E_F = fermilevel(Ntotal2d,T,E_state,meff_state,settings.FD_convergence_test)
+    return E_state,wfe,meff_state,E_F
+
+def stack_states(rows):
+    """The states of each temperature of a sweep (lists) as a 2d array, the
+    rows with fewer subbands (see adapt_subbands) padded with nan"""
+    width = max([len(row) for row in rows]+[0])
+    return np.array([list(row)+[np.nan]*(width-len(row)) for row in rows],dtype=float).reshape(len(rows),width)
+
+# --- SELF-CONSISTENT SOLUTION ---------------------------------------
+
+class PhaseTimer():
+    """Wall time (s) spent in the phases of a calculation. Each call adds the
+    time since the previous call (or since the timer was made) to a phase."""
+    def __init__(self):
+        self.times = {}
+        self.last = time.perf_counter()
+
+    def __call__(self,phase):
+        now = time.perf_counter()
+        self.times[phase] = self.times.get(phase,0.0) + now - self.last
+        self.last = now
+
+# message levels of the self-consistent loop
+QUIET,PROGRESS,DETAIL,DEBUG = 0,1,2,3 # nothing; an iteration summary; the states and charges; each subband
+
+class Events():
+    """The messages of Poisson_Schrodinger. Each one has a level (PROGRESS,
+    DETAIL or DEBUG): it is printed if the level is at most verbosity, logged
+    (logger.info) if at most log_verbosity and there is a log handler, and
+    given to each callback subscribed at that level or above. The diagnostics
+    of a level are only computed when someone listens at it (see wants).
+    verbosity, log_verbosity - config.verbosity and config.log_verbosity if
+        None."""
+    def __init__(self,verbosity=None,log_verbosity=None):
+        self.verbosity = config.verbosity if verbosity is None else verbosity
+        self.log_verbosity = config.log_verbosity if log_verbosity is None else log_verbosity
+        self.callbacks = []
+        
+    def subscribe(self,callback,level=DETAIL):
+        """callback(name,data) is called with the name of each event of at
+        most level and its values (dict), e.g. 'iteration' with iteration, T,
+        E_state, E_F and residual"""
+        self.callbacks.append((callback,level))
+        
+    def log_level(self):
+        """log_verbosity, or QUIET if the log goes nowhere"""
+        if not logger.isEnabledFor(logging.INFO):
+            return QUIET
+        handlers = [hdlr for hdlr in logger.handlers if not isinstance(hdlr,logging.NullHandler)]
+        return self.log_verbosity if handlers or logger.propagate and logging.getLogger().handlers else QUIET
+        
+    def wants(self,level):
+        return (level <= self.verbosity or level <= self.log_level()
+                or any(level <= callback_level for callback,callback_level in self.callbacks))
+        
+    def emit(self,level,name,text,**data):
+        if level <= self.verbosity:
+            print (text)
+        if level <= self.log_level():
+            logger.info(text)
+        for callback,callback_level in self.callbacks:
+            if level <= callback_level:
+                callback(name,data)
+
+def log_to_file(fname,level=logging.INFO):
+    """Sends the log of aestimo to the file fname without slowing down the
+    calculation: the records are queued and written by a separate thread
+    (stopped, and the queue emptied, at exit). Returns the QueueListener."""
+    import queue
+    import logging.handlers
+    records = queue.Queue(-1)
+    hdlr = logging.FileHandler(fname)
+    hdlr.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    listener = logging.handlers.QueueListener(records,hdlr)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(level)
+    return listener
+
+class Results():
+    """Results of Poisson_Schrodinger, all in memory:
+    xaxis (m), dxs (m) - the grid
+    fi, fitot (J) - bandstructure potential and total potential energy
+    sigma (m**-2), F (V/m), V (J) - charge, field and potential of the charge
+    E_state (meV), N_state (m**-2), meff_state (kg), wfe (units dx**0.5) -
+        the subbands and their envelope functions
+    E_F (meV), T (K), Fapp (V/m), Ntotal2d (m**-2)
+        With a list of temperatures (a temperature sweep), T and the values
+        above are those of the last temperature, for every comp_scheme.
+    iteration - number of self-consistent iterations, converged
+    temperatures, sweep_E_F, sweep_E_state, sweep_N_state - E_F, E_state and
+        N_state at each temperature of a temperature sweep (one row each)
+    calctime - calculation time (s)
+    timing - list, for each iteration, of the time (s) spent in each phase
+        (calc_E_state, wf, calc_meff_state, fermilevel, ...), the number of
+        psi_at_inf calls and the Newton steps of each subband (see
+        save_timing)"""
+    def __init__(self,**kwargs):
+        for key,value in kwargs.items():
+            setattr(self,key,value)
+
+def save_checkpoint(fname,**state):
+    """Writes the state of the self-consistent loop to fname (numpy .npz)
+    atomically, a crash while writing leaves the previous checkpoint intact"""
+    tmpname = fname+'.tmp'
+    with open(tmpname,'wb') as fobj:
+        np.savez(fobj,**state)
+        fobj.flush()
+        os.fsync(fobj.fileno())
+    os.replace(tmpname,fname)
+
+def load_checkpoint(fname):
+    """A checkpoint written by Poisson_Schrodinger, as a Results with the
+    state of the loop: xaxis, V, fitot, E_state, wfe, iteration, previousE0,
+    converged, ... A converged checkpoint can be the guess of
+    Poisson_Schrodinger for a related structure."""
+    with np.load(fname) as data:
+        values = dict((name,data[name]) for name in data.files)
+    for name,value in values.items():
+        if value.ndim == 0:
+            values[name] = value.item()
+    values['E_state'] = values['E_state'].tolist()
+    return Results(**values)
+
+def Poisson_Schrodinger(model,settings=None,guess=None,checkpoint=None,checkpoint_interval=None,events=None):
+    """Performs a self-consistent Poisson-Schrodinger calculation of a 1d
+    quantum well structure (model: a Structure). settings - Settings, the
+    values in config.py if None. Returns a Results object.
+    guess - Results of a similar structure, e.g. the previous point of a
+        sweep (continuation): the loop starts from its potential V
+        (interpolated if the grid is different) and looks for the states
+        close to its energies, instead of starting from V = 0.
+    checkpoint - file name: the state of the self-consistent loop is saved
+        to it every checkpoint_interval iterations (config.checkpoint_interval
+        if None, 0 for only at the end). If it holds a checkpoint of the same
+        structure, the loop resumes from it (the Anderson mixing starts
+        afresh), otherwise it is overwritten.
+    events - Events, where the messages go; if None, they are printed up to
+        config.verbosity and logged up to config.log_verbosity, neither if
+        settings.messagesoff (warnings are always printed and logged)."""
+    if settings is None:
+        settings = Settings()
+    if events is None:
+        events = Events(QUIET,QUIET) if settings.messagesoff else Events()
+    if checkpoint_interval is None:
+        checkpoint_interval = config.checkpoint_interval
+    time2 = time.time() # timing audit
+    init_jit(settings.jit)
+    eigensolver = settings.eigensolver
+    if eigensolver in ('matrix','sparse') and not init_scipy():
+        print ("The %s eigensolver needs scipy, using the shooting method instead" %eigensolver)
+        logger.warning("The %s eigensolver needs scipy, using the shooting method instead" %eigensolver)
+        eigensolver = 'shooting'
+    damping = settings.damping
+    # the full predictor step needs the Anderson mixing (with linear mixing it
+    #converges no faster than the damped fixed point)
+    mixing = 'anderson' if settings.poisson_update == 'predictor' else settings.mixing
+    n_max = model.n_max
+    subnumber_e = model.subnumber_e
+    comp_scheme = model.comp_scheme
+    fi = model.fi
+    cb_meff = model.cb_meff
+    temperatures = np.atleast_1d(np.asarray(model.T,dtype=float)) #a list of temperatures runs a temperature sweep
+    
+    # Preparing empty subband energy lists.
+    E_state = [0.0]*subnumber_e     # Energies of subbands/levels (meV)
+    N_state = [0.0]*subnumber_e     # Number of carriers in subbands  
+    
+    # Creating the solution arrays (allocated once, updated in place by the loop)
+    fitot = np.zeros(n_max)	#Energy potential = Bandstructure + Coulombic potential
+    sigma = np.zeros(n_max)	#charge distribution (donors + free charges)
+    F = np.zeros(n_max)		#Electric Field
+    V = np.zeros(n_max)		#Electric Potential
+    Vnew = np.zeros(n_max)	#Electric Potential of the last charge distribution
+    dV = np.zeros(n_max)	#Change of the Electric Potential
+    Vapp = np.zeros(n_max)	#Electric Potential
+    # Subband wavefunction for electron list. 2-dimensional: [i][j] i:stateno, j:wavefunc
+    wfe = np.zeros((subnumber_e,n_max),dtype = float)
+    
+    Ntotal2d = np.sum(model.dop*model.w) # calculating total doping density m-2
+    events.emit(PROGRESS,'start',"Ntotal2d %g m**-2" %Ntotal2d,n_max=n_max,Ntotal2d=Ntotal2d)
+    
+    # Applied Field
+    x0=np.sum(model.dxs)/2.0 # Finding the middle point (z0) of z-axis for Fapp
+    Vapp[:] = q*model.Fapp*(model.xaxis-x0)
+    
+    # STARTING SELF CONSISTENT LOOP
+    np.add(fi,Vapp,out=fitot)  # Adding field qF(z-z0)
+    
+    fi_min= fitot.min() #minimum potential energy of structure (for limiting the energy range when searching for states)
+    if abs(settings.E_start)>1e-3*meV2J: #energyx is the minimum energy (meV) when starting the search for bound states.
+        energyx = settings.E_start
+    else:
+        energyx = fi_min
+    
+    warm = guess is not None and (len(guess.E_state) == subnumber_e or settings.auto_subbands)
+    if warm:
+        subnumber_e = len(guess.E_state)
+        wfe = np.zeros((subnumber_e,n_max),dtype = float)
+        # continuation from a previous solution
+        same_grid = len(guess.xaxis) == n_max and np.array_equal(guess.xaxis,model.xaxis)
+        if comp_scheme == 2:
+            V[:] = guess.V if same_grid else np.interp(model.xaxis,guess.xaxis,guess.V)
+            fitot += V
+        E_state = list(guess.E_state)
+        for j in range(subnumber_e):
+            wfe[j] = guess.wfe[j] if same_grid else np.interp(model.xaxis,guess.xaxis,guess.wfe[j])
+        energyx = min(fi_min,fitot.min())
+    
+    sweep = len(temperatures) > 1
+    sweep_E_F,sweep_E_state,sweep_N_state = [],[],[] #results at each temperature of a sweep
+    timing = [] #phase times and counters of each iteration
+    solved = False #the states have been found once, they are the starting point of the next search
+    converged = True
+    
+    resume = None
+    if checkpoint is not None and comp_scheme == 2:
+        fingerprint = model.fingerprint()
+        def write_checkpoint(T_index,iteration,previousE0,finished=False):
+            n = T_index # the temperatures done
+            save_checkpoint(checkpoint,fingerprint=fingerprint,xaxis=model.xaxis,V=V,fitot=fitot,
+                            E_state=E_state,wfe=wfe,iteration=iteration,previousE0=previousE0,
+                            T_index=T_index,converged=finished and converged,
+                            sweep_E_F=sweep_E_F[:n],sweep_E_state=stack_states(sweep_E_state[:n]),
+                            sweep_N_state=stack_states(sweep_N_state[:n]))
+        if os.path.exists(checkpoint):
+            resume = load_checkpoint(checkpoint)
+            if resume.fingerprint != fingerprint:
+                print ("The checkpoint %s is of another structure, starting afresh" %checkpoint)
+                logger.warning("The checkpoint %s is of another structure, starting afresh" %checkpoint)
+                resume = None
+        if resume is not None:
+            events.emit(PROGRESS,'resume',"Resuming from the checkpoint %s (iteration %d)" %(checkpoint,resume.iteration),
+                        checkpoint=checkpoint,iteration=resume.iteration)
+            V[:] = resume.V
+            np.add(fi,V,out=fitot)
+            fitot += Vapp
+            E_state = list(resume.E_state)
+            wfe = resume.wfe.copy()
+            subnumber_e = len(E_state)
+            sweep_E_F = list(resume.sweep_E_F)
+            sweep_E_state = [row[~np.isnan(row)].tolist() for row in resume.sweep_E_state]
+            sweep_N_state = [row[~np.isnan(row)].tolist() for row in resume.sweep_N_state]
+            solved = True
+    # Only the self-consistent scheme has states that depend on T. The other schemes solve the
+    #states once and then find the Fermi levels of all the temperatures together (below).
+    for k,T in enumerate(temperatures if comp_scheme == 2 else temperatures[:1]):
+        if resume is not None and k < resume.T_index:
+            continue # done before the checkpoint
+        if sweep:
+            events.emit(PROGRESS,'temperature',"Temperature: %g K" %T,T=T)
+        iteration = 1   #iteration counter
+        previousE0= 0   #(meV) energy of zeroth state for previous iteration(for testing convergence)
+        if resume is not None and k == resume.T_index:
+            iteration,previousE0 = resume.iteration,resume.previousE0
+        previous_residual = None #(meV) largest |Vnew-V| of the previous iteration
+        mixing_history_list = [] #(V,Vnew-V) of the previous iterations for the Anderson mixing
+        while True:
+            detail = events.wants(DETAIL) # the states and charges are reported
+            if detail:
+                events.emit(DETAIL,'iteration_start',"Iteration: %d" %iteration,iteration=iteration)
+            if solved:
+                energyx = min(fi_min,fitot.min())
+            timer = PhaseTimer()
+            reset_counters()
+        
+            if eigensolver == 'matrix':
+                E_state,wfe = calc_E_state_matrix(subnumber_e,fitot,model,energyx)
+            elif eigensolver == 'sparse':
+                wfe_guess = wfe if (settings.warmstart and (solved or warm)) else None
+                E_state,wfe = calc_E_state_sparse(subnumber_e,fitot,model,energyx,wfe_guess)
+            else:
+                E_guess = E_state if (settings.warmstart and (solved or warm)) else None
+                # the automatic count needs every state below the highest one (no skipped levels)
+                E_state=calc_E_state(subnumber_e,fitot,model,energyx,settings,E_guess,
+                                     index=0 if settings.auto_subbands else None,events=events)
+                timer('calc_E_state')
+            
+                # Envelope Function Wave Functions
+                debug = events.wants(DEBUG)
+                for j in range(0,subnumber_e,1):
+                    if debug:
+                        events.emit(DEBUG,'subband',"Working for subband no: %d" %(j+1),subband=j+1)
+                    wfe[j] = wf(E_state[j]*meV2J,fitot,model) #wavefunction units dx**0.5
+                timer('wf')
+            if eigensolver in ('matrix','sparse'):
+                timer('calc_E_state') # and the wavefunctions
+        
+            solved = True
+            # Calculate the effective mass of each subband
+            meff_state = calc_meff_state(wfe,cb_meff)
+            timer('calc_meff_state')
+        
+            ## Self-consistent Poisson
+        
+            # Calculate the Fermi energy and subband populations at 0K
+            #E_F_0K,N_state_0K=fermilevel_0K(Ntotal2d,E_state,meff_state)
+            # Calculate the Fermi energy at the temperature T (K)
+            E_F = fermilevel(Ntotal2d,T,E_state,meff_state,settings.FD_convergence_test,
+                             warn=not settings.auto_subbands) # the states are completed below
+            if settings.auto_subbands:
+                timer('fermilevel')
+                # the other schemes use these states at all the temperatures of a sweep
+                E_state,wfe,meff_state,E_F = adapt_subbands(E_state,wfe,meff_state,E_F,
+                                                            T if comp_scheme == 2 else temperatures.max(),
+                                                            Ntotal2d,fitot,model,energyx,settings,eigensolver)
+                if comp_scheme != 2:
+                    E_F = fermilevel(Ntotal2d,T,E_state,meff_state,settings.FD_convergence_test)
+                timer('calc_E_state') # the states added
+                if len(E_state) != subnumber_e:
+                    subnumber_e = len(E_state)
+                    events.emit(DETAIL,'subbands',"Number of subbands: %d" %subnumber_e,subnumber_e=subnumber_e)
+            # Calculate the subband populations at the temperature T (K)
+            N_state=calc_N_state(E_F,T,Ntotal2d,E_state,meff_state)
+            timer('fermilevel')
+            # Calculate `net' areal charge density
+            calc_sigma(wfe,N_state,model,out=sigma) #one more instead of subnumber_e
+            timer('calc_sigma')
+            # Calculate electric field
+            calc_field(sigma,model.eps,out=F)
+            timer('calc_field')
+            # Calculate potential due to charge distribution
+            calc_potn(F,model,out=Vnew)
+            timer('calc_potn')
+            #       
+            #status
+            if detail:
+                for i,level in enumerate(E_state):
+                    events.emit(DETAIL,'state',"E[%d]= %f meV" %(i,level),index=i,E=level)
+                for i,meff in enumerate(meff_state):
+                    events.emit(DETAIL,'state',"meff[%d]= %f" %(i,meff/m_e),index=i,meff=meff)
+                for i,Ni in enumerate(N_state):
+                    events.emit(DETAIL,'state',"N[%d]= %g m**-2" %(i,Ni),index=i,N=Ni)
+                #print 'Efermi (at 0K) = ',E_F_0K,' meV'
+                #for i,Ni in enumerate(N_state_0K):
+                #    print 'N[',i,']= ',Ni
+                events.emit(DETAIL,'fermilevel',"Efermi (at %gK) = %g meV" %(T,E_F),T=T,E_F=E_F)
+                level_charge,system_charge = sum(N_state),np.sum(sigma)
+                events.emit(DETAIL,'charge',"total donor charge = %g m**-2\ntotal level charge = %g m**-2\n"
+                            "total system charge = %g m**-2" %(Ntotal2d,level_charge,system_charge),
+                            donor_charge=Ntotal2d,level_charge=level_charge,system_charge=system_charge)
+            #
+            timer('messages')
+            timing.append(dict(timer.times,iteration=iteration,T=T,psi_at_inf=counters['psi_at_inf'],
+                               psi_at_inf_batch=counters['psi_at_inf_batch'],
+                               psi_at_inf_batch_energies=counters['psi_at_inf_batch_energies'],
+                               newton_steps=list(counters['newton_steps'])))
+            if comp_scheme in (0,1): 
+                #if we are not self-consistently including Poisson Effects then only do one loop
+                events.emit(PROGRESS,'iteration',"Iteration %d: E[0]= %f meV, Efermi= %f meV" %(iteration,E_state[0],E_F),
+                            iteration=iteration,T=T,E_state=E_state,E_F=E_F,residual=None)
+                break 
+            
+            np.subtract(Vnew,V,out=dV)
+            residual = np.max(np.abs(dV))/meV2J
+            events.emit(PROGRESS,'iteration',"Iteration %d: E[0]= %f meV, Efermi= %f meV, max|Vnew-V|= %g meV"
+                        %(iteration,E_state[0],E_F,residual),
+                        iteration=iteration,T=T,E_state=E_state,E_F=E_F,residual=residual)
+        
+            # Combine band edge potential with potential due to charge distribution
+            Vnext = None
+            if settings.poisson_update == 'predictor' and Ntotal2d < 0: # only electrons follow the potential
+                # the predicted potential already accounts for the response of the charge
+                Vnext = calc_potn_predictor(E_state,wfe,meff_state,E_F,V,T,model,settings.convergence_test)
+                step = 1.0
+            if Vnext is None: # fixed point step
+                Vnext = Vnew
+                step = damping
+            if mixing == 'anderson':
+                if previous_residual is not None and residual > previous_residual:
+                    # the extrapolation stalled: restart it from a damped fixed point step
+                    events.emit(DETAIL,'mixing',"Anderson mixing stalled, linear mixing for this iteration",iteration=iteration)
+                    mixing_history_list = []
+                    dV *= damping # dV = Vnew - V
+                    V += dV
+                    previous_residual = None
+                else:
+                    V[:] = anderson_mix(V,Vnext,mixing_history_list,step,settings.mixing_history)
+                    previous_residual = residual
+            else:
+                # To increase convergence, we calculate a moving average of electric potential 
+                #with previous iterations. By dampening the corrective term, we avoid oscillations.
+                np.subtract(Vnext,V,out=dV)
+                dV *= step
+                V += dV
+            np.add(fi,V,out=fitot)
+            fitot += Vapp
+            timer('potential_update') # predictor and mixing
+            timing[-1].update(timer.times)
+            
+            if abs(E_state[0]-previousE0) < settings.convergence_test: #Convergence test
+                break
+            elif iteration > settings.max_iterations: #Iteration limit
+                print ("Have reached maximum number of iterations")
+                logger.warning("Have reached maximum number of iterations")
+                converged = False
+                break
+            else:
+                iteration += 1
+                previousE0 = E_state[0]
+                if checkpoint is not None and checkpoint_interval and (iteration-1) % checkpoint_interval == 0:
+                    write_checkpoint(k,iteration,previousE0)
+        # a sweep starts the next temperature from this converged potential and these states
+        sweep_E_F.append(E_F)
+        sweep_E_state.append(E_state)
+        sweep_N_state.append(N_state)
+        if checkpoint is not None and comp_scheme == 2:
+            if k < len(temperatures)-1:
+                write_checkpoint(k+1,1,0)
+            else: # resuming from here checks the convergence once more
+                write_checkpoint(k,iteration,E_state[0],finished=True)
+    
+    if sweep and comp_scheme in (0,1):
+        # the states don't depend on T
+        sweep_E_F = fermilevel(Ntotal2d,temperatures,E_state,meff_state,settings.FD_convergence_test)
+        sweep_N_state = calc_N_state(sweep_E_F,temperatures,Ntotal2d,E_state,meff_state)
+        sweep_E_state = [E_state]*len(temperatures)
+        # the results are those of the last temperature, as with comp_scheme 2
+        T,E_F,N_state = temperatures[-1],sweep_E_F[-1],sweep_N_state[-1]
+        calc_sigma(wfe,N_state,model,out=sigma)
+        calc_field(sigma,model.eps,out=F)
+    # END OF SELF-CONSISTENT LOOP
+    time3 = time.time() # timing audit
+    events.emit(PROGRESS,'finished',"calculation time  %g s" %(time3 - time2),
+                iteration=iteration,converged=converged,calctime=time3-time2)
+    
+    return Results(xaxis=model.xaxis.copy(),dxs=model.dxs.copy(),fi=fi.copy(),fitot=fitot,
+                   sigma=sigma,F=F,V=V,E_state=E_state,N_state=N_state,meff_state=meff_state,
+                   wfe=wfe,E_F=E_F,T=T,Fapp=model.Fapp,Ntotal2d=Ntotal2d,
+                   iteration=iteration,converged=converged,temperatures=temperatures,
+                   sweep_E_F=np.asarray(sweep_E_F),sweep_E_state=stack_states(sweep_E_state),
+                   sweep_N_state=stack_states(sweep_N_state),calctime=time3-time2,timing=timing)
+
+# --- OUTPUT ---------------------------------------------------------
+
+def save_and_plot(result,model,output_directory=None,plot=None,settings=None,output_format=None):
+    """Writes the results to output_directory (config.output_directory if
+    None, the files chosen in config.py) and shows them if plot is True
+    (config.resultviewer if None), or writes them to results.png and qw.png
+    in the background if plot is 'file' (see render_results). matplotlib is
+    only imported to plot.
+    output_format - 'text' (the .dat files), 'binary' (see save_binary) or
+    'both', config.output_format if None. settings - the Settings of the
+    calculation, recorded with the binary output (config.py if None)."""
+    if output_directory is None:
+        output_directory = config.output_directory
+    if plot is None:
+        plot = config.resultviewer
+    if output_format is None:
+        output_format = config.output_format
+    if output_format not in ('text','binary','both'):
+        raise ValueError("unknown output format %s" %output_format)
+    text = output_format in ('text','both')
+    time0 = time.perf_counter() # timing of the output
+    xaxis = result.xaxis
+    subnumber_e = len(result.E_state) # model.subnumber_e, or as found (config.auto_subbands)
+    
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+    
+    def saveoutput(fname,datatuple,header=None):
+        fname2 = os.path.join(output_directory,fname)
+        fobj = open(fname2,'w+')
+        if header: fobj.write(header+'\n')
+        np.savetxt(fobj,np.column_stack(datatuple),fmt='%.6e', delimiter=' ')
+        fobj.close()
+    
+    def saveoutput2(fname2,datatuple,header=None,fmt='%.6g',delimiter=', '):
+        fname2 = os.path.join(output_directory,fname2)
+        fobj = open(fname2,'w+')
+        if header: fobj.write(header+'\n')
+        np.savetxt(fobj,np.column_stack(datatuple),fmt=fmt, delimiter=delimiter)
+        fobj.close()
+    
+    if text and config.parameters:
+        saveoutput2("parameters.dat",header=('T (K), Fapp (V/m), E_F (meV)'),
+                    datatuple=(result.T,result.Fapp,result.E_F))
+    if text and len(result.temperatures) > 1:
+        nstates = result.sweep_E_state.shape[1]
+        header = " ".join(["T(K)","E_F(meV)"]+["E%d(meV)" %j for j in range(nstates)]+["N%d(m**-2)" %j for j in range(nstates)])
+        saveoutput("temperature_sweep.dat",(result.temperatures,result.sweep_E_F,result.sweep_E_state,result.sweep_N_state),header)
+    if text and config.sigma_out:
+        saveoutput("sigma.dat",(xaxis,result.sigma))
+    if text and config.electricfield_out:
+        saveoutput("efield.dat",(xaxis,result.F))
+    if text and config.potential_out:
+        saveoutput("potn.dat",(xaxis,result.fitot))
+    if text and config.states_out:
+        rel_meff_state = [meff/m_e for meff in result.meff_state] #going to report relative effective mass.
+        header = "State No.    Energy (meV) N (m**-2)    Subband m* (kg)"
+        saveoutput("states.dat",(range(subnumber_e),result.E_state,result.N_state,rel_meff_state), header)
+    if text and config.probability_out:
+        saveoutput("wavefunctions.dat",(xaxis,result.wfe.transpose()) )
+    if output_format in ('binary','both'):
+        save_binary(result,model,output_directory,settings)
+    if config.timing_out and getattr(result,'timing',None) is not None:
+        save_timing(result,output_directory,time.perf_counter()-time0)
+    
+    # Resultviewer
+    
+    if plot == 'file':
+        render_results(result,output_directory)
+    elif plot:
+        plot_results(result)
+
+def decimate(x,y,columns):
+    """Shape preserving decimation of the trace y(x) for plotting: x is cut
+    into columns equal slices and only the lowest and the highest point of
+    each slice are kept (and the end points), so that the peaks of the
+    trace are still drawn. Returns x,y (unchanged if they are short)."""
+    n = len(x)
+    if n <= 2*columns:
+        return x,y
+    column = np.minimum(((x-x[0])*(columns/(x[-1]-x[0]))).astype(int),columns-1)
+    starts = np.flatnonzero(np.r_[True,column[1:] != column[:-1]])
+    counts = np.diff(np.r_[starts,n])
+    index = np.arange(n)
+    imin = np.minimum.reduceat(np.where(y == np.repeat(np.minimum.reduceat(y,starts),counts),index,n),starts)
+    imax = np.minimum.reduceat(np.where(y == np.repeat(np.maximum.reduceat(y,starts),counts),index,n),starts)
+    keep = np.unique(np.r_[0,imin,imax,n-1])
+    return x[keep],y[keep]
+
+def plot_results(result,output_directory=None,columns=None,scalefactor=None):
+    """Draws the results (matplotlib): the charge, field, potential and
+    wavefunctions, and the QW representation. The traces are decimated to
+    columns (config.plot_columns if None) slices, see decimate. Shows the
+    figures, or writes them to output_directory (results.png and qw.png)."""
+    if columns is None:
+        columns = config.plot_columns
+    if scalefactor is None:
+        scalefactor = config.wavefunction_scalefactor
+    import matplotlib.pyplot as pl
+    xaxis = np.asarray(result.xaxis)
+    def trace(y):
+        return decimate(xaxis,np.asarray(y),columns)
+    
+    fig1 = pl.figure(figsize=(10,8))
+    pl.suptitle('Aestimo Results')
+    pl.subplots_adjust(hspace=0.4,wspace=0.4)
+                          
+    #Plotting Sigma
+    #figure(0)
+    pl.subplot(2,2,1)
+    pl.plot(*trace(result.sigma))
+    pl.xlabel('Position (m)')
+    pl.ylabel('Sigma (e/m^2)')
+    pl.title('Sigma')
+    pl.grid(True)
+
+    #Plotting Efield
+    #figure(1)
+    pl.subplot(2,2,2)
+    pl.plot(*trace(result.F))
+    pl.xlabel('Position (m)')
+    pl.ylabel('Electric Field strength (V/m)')
+    pl.title('Electric Field')
+    pl.grid(True)
+
+    #Plotting Potential
+    #figure(2)
+    pl.subplot(2,2,3)
+    pl.plot(*trace(result.fitot))
+    pl.xlabel('Position (m)')
+    pl.ylabel('E_c (J)')
+    pl.title('Potential')
+    pl.grid(True)
+
+    #Plotting State(s)
+    #figure(3)
+    pl.subplot(2,2,4)
+    for j,state in enumerate(result.wfe):
+        pl.plot(*trace(state), label='state %d' %j)
+    pl.xlabel('Position (m)')
+    pl.ylabel('Psi')
+    pl.title('First state')
+    pl.grid(True)
+    
+    #QW representation
+    #figure(5)
+    fig2 = pl.figure(figsize=(10,8))
+    pl.suptitle('Aestimo Results')
+    pl.subplot(1,1,1)
+    pl.plot(*trace(np.array(result.fitot)*J2meV),color='k')
+    for level,state in zip(result.E_state,result.wfe): 
+        pl.axhline(level,0.1,0.9,color='g',ls='--')
+        pl.plot(*trace(np.array(state)*scalefactor+level),color='b')
+        #pl.plot(xaxis, np.array(state)**2*1e-9/dx*200.0+level,'b')
+    pl.axhline(result.E_F,0.1,0.9,color='r',ls='--')
+    pl.xlabel('Position (m)')
+    pl.ylabel('Energy (meV)')
+    pl.grid(True)
+    if output_directory is None:
+        pl.show()
+    else:
+        fig1.savefig(os.path.join(output_directory,'results.png'))
+        fig2.savefig(os.path.join(output_directory,'qw.png'))
+        pl.close(fig1)
+        pl.close(fig2)
+
+renders = [] # the process of render_results still running, waited for at exit
+
+def wait_for_render():
+    """Waits for the background process of render_results to finish"""
+    while renders:
+        renders.pop().wait()
+atexit.register(wait_for_render)
+
+def render_results(result,output_directory):
+    """Writes the figures of plot_results to output_directory (results.png
+    and qw.png) in a background process with a non-interactive matplotlib
+    backend, the caller goes on at once. Only one such process runs at a
+    time (the next call waits for it) and the end of the program waits for
+    it too. Returns the process (Popen)."""
+    import subprocess,sys,tempfile
+    wait_for_render()
+    fd,fname = tempfile.mkstemp(prefix='.figures-',suffix='.npz',dir=output_directory)
+    with os.fdopen(fd,'wb') as fobj:
+        np.savez(fobj,xaxis=result.xaxis,sigma=result.sigma,F=result.F,fitot=result.fitot,wfe=result.wfe,
+                 E_state=result.E_state,E_F=result.E_F,columns=config.plot_columns,
+                 scalefactor=config.wavefunction_scalefactor)
+    env = dict(os.environ,MPLBACKEND='Agg')
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__))]+
+                                        [path for path in [env.get('PYTHONPATH')] if path])
+    renders.append(subprocess.Popen([sys.executable,'-c','import sys,aestimo; aestimo.render_figures(*sys.argv[1:])',
+                                     fname,output_directory],env=env))
+    return renders[-1]
+
+def render_figures(fname,output_directory):
+    """The background process of render_results: plots the results saved in
+    fname (which is then deleted) to output_directory"""
+    import matplotlib
+    matplotlib.use('Agg')
+    try:
+        with np.load(fname) as data:
+            values = AttrDict((name,data[name]) for name in data.files)
+    finally:
+        os.remove(fname)
+    plot_results(values,output_directory,int(values.columns),float(values.scalefactor))
+
+# units of the results written by save_binary
+result_units = {'xaxis':'m','dxs':'m','fi':'J','fitot':'J','V':'J','sigma':'m**-2','F':'V/m',
+                'wfe':'(grid normalised, sum of wfe**2 is 1)','E_state':'meV','N_state':'m**-2',
+                'meff_state':'kg','temperatures':'K','sweep_E_F':'meV','sweep_E_state':'meV',
+                'sweep_N_state':'m**-2','E_F':'meV','T':'K','Fapp':'V/m','Ntotal2d':'m**-2',
+                'iteration':'','converged':'','calctime':'s'}
+
+# the phases and counters of the timing report
+timing_phases = ('calc_E_state','wf','calc_meff_state','fermilevel','calc_sigma','calc_field',
+                 'calc_potn','potential_update','messages')
+timing_counters = ('psi_at_inf','psi_at_inf_batch','psi_at_inf_batch_energies')
+
+def save_timing(result,output_directory,output_time=None):
+    """Writes the timing report of a calculation (Results.timing) to
+    output_directory:
+    timing.json - the phase times (s) and counters of each iteration, their
+        totals ('other': the rest of the calculation time, e.g. the setup and
+        loading numba), the calculation time and the time taken to write the
+        output
+    timing.csv - one row per iteration (newton_steps_j: Newton steps of
+        subband j, none for the matrix and sparse eigensolvers or the
+        subbands not solved in that iteration)
+    A result read from the cache (result.cached) was not calculated in this
+    run: timing.json only gives 'cached': true, the time of the lookup and
+    the calculation time of the stored result, there is no timing.csv."""
+    if getattr(result,'cached',False):
+        report = {'cached':True,'lookup_time':result.lookup_time,'stored_calctime':result.calctime,'output':output_time}
+        with open(os.path.join(output_directory,'timing.json'),'w') as fobj:
+            json.dump(report,fobj,indent=1)
+        if os.path.exists(os.path.join(output_directory,'timing.csv')): # of an earlier run
+            os.remove(os.path.join(output_directory,'timing.csv'))
+        return
+    timing = result.timing
+    subnumber_e = max([len(row['newton_steps']) for row in timing]+[0])
+    totals = dict((name,sum(row.get(name,0) for row in timing)) for name in timing_phases+timing_counters)
+    totals['newton_steps'] = [sum(row['newton_steps'][j] for row in timing if len(row['newton_steps']) > j)
+                              for j in range(subnumber_e)]
+    totals['other'] = result.calctime - sum(totals[name] for name in timing_phases) # setup, loading numba
+    report = {'cached':False,'iterations':timing,'totals':totals,'calctime':result.calctime,'output':output_time}
+    with open(os.path.join(output_directory,'timing.json'),'w') as fobj:
+        json.dump(report,fobj,indent=1,default=lambda x: x.tolist() if hasattr(x,'tolist') else str(x))
+    header = ['iteration','T']+list(timing_phases)+list(timing_counters)+['newton_steps_%d' %j for j in range(subnumber_e)]
+    with open(os.path.join(output_directory,'timing.csv'),'w') as fobj:
+        fobj.write(','.join(header)+'\n')
+        for row in timing:
+            values = [row['iteration'],row['T']]+[row.get(name,0) for name in timing_phases+timing_counters]
+            values += row['newton_steps']+['']*(subnumber_e-len(row['newton_steps']))
+            fobj.write(','.join(['%.6g' %value if isinstance(value,float) else str(value) for value in values])+'\n')
+
+def save_binary(result,model,output_directory,settings=None):
+    """Writes the results as .npy arrays (that can be read memory mapped)
+    and results.json, which describes them: the file, units and shape of
+    each array, the scalar results, the grid, the input parameters and the
+    solver settings (config.py if None). load_results reads them back."""
+    if settings is None:
+        settings = Settings()
+    names = ['xaxis','dxs','E_state','N_state','meff_state']
+    if config.sigma_out:
+        names += ['sigma']
+    if config.electricfield_out:
+        names += ['F']
+    if config.potential_out:
+        names += ['fi','fitot','V']
+    if config.probability_out:
+        names += ['wfe']
+    if len(result.temperatures) > 1:
+        names += ['temperatures','sweep_E_F','sweep_E_state','sweep_N_state']
+    arrays = {}
+    for name in names:
+        value = np.asarray(getattr(result,name),dtype=float)
+        np.save(os.path.join(output_directory,name+'.npy'),value)
+        arrays[name] = {'file':name+'.npy','units':result_units[name],'shape':value.shape}
+    metadata = {'format':'aestimo results','version':1,'arrays':arrays,
+                'values':dict((name,getattr(result,name)) for name in ('E_F','T','Fapp','Ntotal2d','iteration','converged','calctime')),
+                'units':dict((name,result_units[name]) for name in ('E_F','T','Fapp','Ntotal2d','calctime')),
+                'grid':{'n_max':model.n_max,'mesh':model.mesh,'x_max (m)':np.sum(model.dxs),
+                        'dx_min (m)':np.min(model.dxs),'dx_max (m)':np.max(model.dxs)},
+                'input':{'material':model.material,'T':model.T,'Fapplied':model.Fapp,'subnumber_e':model.subnumber_e,
+                         'computation_scheme':model.comp_scheme,'gridfactor':model.dx*1e9,
+                         'maxgridpoints':model.maxgridpoints,'mesh':model.mesh,
+                         'mesh_coarse':model.mesh_coarse*1e9,'mesh_ratio':model.mesh_ratio},
+                'settings':dict((name,getattr(settings,name)) for name in settings.names)}
+    # written last, and atomically, it marks the arrays as complete
+    fname = os.path.join(output_directory,'results.json')
+    with open(fname+'.tmp','w') as fobj:
+        json.dump(metadata,fobj,indent=1,default=lambda x: x.tolist() if hasattr(x,'tolist') else str(x))
+    os.replace(fname+'.tmp',fname)
+
+def run_aestimo(inputfile,settings=None):
+    """Solves the structure of an input file (module or dict), then saves
+    and plots the results (from the result cache if it has been solved
+    before, see config.cache). Returns the Results."""
+    import aestimo_cache
+    model = StructureFrom(inputfile,database)
+    result = aestimo_cache.Poisson_Schrodinger(model,settings)
+    save_and_plot(result,model,settings=settings)
+    return result
+
+class LazyResults():
+    """Results read back by load_results. Each result is read from its file
+    when it is first accessed (the binary arrays memory mapped), e.g.
+    load_results().E_state reads only the states. metadata - the contents
+    of results.json (binary output), None for the text output."""
+    def __init__(self,loaders,metadata=None):
+        self._loaders = loaders # name -> function returning the value
+        self.metadata = metadata
+    
+    def __getattr__(self,name):
+        loaders = self.__dict__.get('_loaders',{})
+        if name not in loaders:
+            raise AttributeError(name)
+        value = loaders[name]()
+        setattr(self,name,value)
+        return value
+    
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._loaders))
+
+def load_results(output_directory=None):
+    """Loads the results stored in the output folder (config.output_directory
+    if None) by save_and_plot, the binary output if there is one, otherwise
+    the text files. Returns a LazyResults."""
+    if output_directory is None:
+        output_directory = config.output_directory
+    path = lambda fname: os.path.join(output_directory,fname)
+    loaders = {}
+    
+    if os.path.exists(path('results.json')):
+        with open(path('results.json')) as fobj:
+            metadata = json.load(fobj)
+        for name,array in metadata['arrays'].items():
+            loaders[name] = lambda fname=path(array['file']): np.load(fname,mmap_mode='r')
+        for name,value in metadata['values'].items():
+            loaders[name] = lambda value=value: value
+        loaders['subnumber_e'] = lambda: len(loaders['E_state']())
+        return LazyResults(loaders,metadata)
+    
+    files = {} # the columns of the text files read so far
+    def loadoutput(fname,skiprows=0,delimiter=' '):
+        if fname not in files:
+            files[fname] = np.loadtxt(path(fname),delimiter=delimiter,skiprows=skiprows,unpack=True,ndmin=2)
+        return files[fname]
+    
+    if os.path.exists(path("parameters.dat")):
+        for k,name in enumerate(('T','Fapp','E_F')):
+            loaders[name] = lambda k=k: loadoutput("parameters.dat",1,',')[k][0]
+    for fname,name in (("sigma.dat","sigma"),("efield.dat","F"),("potn.dat","fitot"),("wavefunctions.dat","wfe")):
+        if os.path.exists(path(fname)):
+            loaders[name] = lambda fname=fname: loadoutput(fname)[1:] if fname == "wavefunctions.dat" else loadoutput(fname)[1]
+            loaders.setdefault('xaxis',lambda fname=fname: loadoutput(fname)[0])
+    if os.path.exists(path("states.dat")):
+        loaders.update(subnumber_e=lambda: len(loadoutput("states.dat",1)[0]),
+                       E_state=lambda: loadoutput("states.dat",1)[1],
+                       N_state=lambda: loadoutput("states.dat",1)[2],
+                       meff_state=lambda: loadoutput("states.dat",1)[3]*m_e)
+    if os.path.exists(path("temperature_sweep.dat")):
+        n = lambda: (len(loadoutput("temperature_sweep.dat",1))-2)//2 # number of states
+        loaders.update(temperatures=lambda: loadoutput("temperature_sweep.dat",1)[0],
+                       sweep_E_F=lambda: loadoutput("temperature_sweep.dat",1)[1],
+                       sweep_E_state=lambda: loadoutput("temperature_sweep.dat",1)[2:2+n()].T,
+                       sweep_N_state=lambda: loadoutput("temperature_sweep.dat",1)[2+n():].T)
+    results = LazyResults(loaders)
+    if 'xaxis' in loaders:
+        loaders['dx'] = lambda: np.mean(np.diff(results.xaxis))
+    return results
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  On-disk cache of solved structures. A structure that has
+               been solved before with the same solver settings is read
+               back from config.cache_directory instead of being solved
+               again:
+
+                   result = aestimo_cache.Poisson_Schrodinger(model,settings)
+
+               The key is a hash of what the solution depends on: the
+               rasterized structure (see Structure.fingerprint, only the
+               database values of the materials in use count), T, Fapplied,
+               subnumber_e, computation_scheme, the solver settings and the
+               source of the solver (aestimo.py, aestimo_numba.py), so that
+               a changed solver never returns the results of the old one.
+               Each entry is one .npz file; the least recently used ones are
+               deleted when the cache grows over config.cache_size_limit.
+               The cache is off unless config.cache = True (main.py --set
+               cache=True) or a ResultCache is given; cache=False bypasses
+               it, refresh=True solves again and replaces the entry.
+"""
+import hashlib
+import json
+import os
+import time
+import zipfile
+import numpy as np
+
+import config
+import aestimo
+from aestimo import logger
+
+# changes whenever the solver gives different results for the same input,
+# so that older entries are no longer found
+cache_version = 1
+
+# the source of the solver is part of the key as well: after any change of
+# aestimo.py (or the compiled kernels) the entries made before are not found
+solver_files = ('aestimo.py','aestimo_numba.py')
+_solver_hash = None
+
+def solver_hash():
+    """Hash (hex string) of the source files of the solver"""
+    global _solver_hash
+    if _solver_hash is None:
+        sha = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(aestimo.__file__))
+        for name in solver_files:
+            fname = os.path.join(directory,name)
+            if os.path.exists(fname):
+                with open(fname,'rb') as fobj:
+                    sha.update(fobj.read())
+        _solver_hash = sha.hexdigest()
+    return _solver_hash
+
+# settings that don't change the results (max_iterations: only converged results are stored)
+ignored_settings = ('messagesoff','jit','max_iterations')
+
+class ResultCache():
+    """A directory of solved structures (one .npz file per key) of at most
+    size_limit bytes, the least recently used entries are deleted first."""
+    def __init__(self,directory=None,size_limit=None):
+        self.directory = config.cache_directory if directory is None else directory
+        self.size_limit = config.cache_size_limit*1e6 if size_limit is None else size_limit
+
+    def key(self,model,settings):
+        """Hash (hex string) of the structure and the solver settings"""
+        return model.fingerprint(version=cache_version,solver=solver_hash(),
+                                 settings=dict((name,getattr(settings,name)) for name in settings.names
+                                               if name not in ignored_settings))
+
+    def filename(self,key):
+        return os.path.join(self.directory,key+'.npz')
+
+    def get(self,key):
+        """The Results stored under key, None if there are none"""
+        fname = self.filename(key)
+        try:
+            with np.load(fname) as data:
+                values = dict((name,data[name]) for name in data.files)
+            os.utime(fname,None) # most recently used
+        except (IOError,OSError,ValueError,EOFError,zipfile.BadZipFile): # missing, or deleted or damaged meanwhile
+            return None
+        except Exception: # damaged otherwise, e.g. a garbled array header
+            logger.warning("cache: damaged entry %s" %os.path.basename(fname))
+            return None
+        for name,value in values.items():
+            if value.ndim == 0:
+                values[name] = value.item()
+        for name in ('E_state','N_state','meff_state'):
+            values[name] = values[name].tolist()
+        values['timing'] = json.loads(values.get('timing','[]'))
+        return aestimo.Results(**values)
+
+    def put(self,key,result):
+        """Stores result under key, then trims the cache to size_limit"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fname = self.filename(key)
+        tmpname = '%s.%d.tmp.npz' %(fname[:-4],os.getpid())
+        try:
+            values = dict(vars(result))
+            values['timing'] = json.dumps(getattr(result,'timing',[]),default=float) # list of dicts
+            np.savez(tmpname,**values)
+            os.replace(tmpname,fname) # atomic, other processes never see half a file
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+        self.trim()
+
+    def entries(self):
+        """(last use, size, filename) of the entries, least recently used first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                fname = os.path.join(self.directory,name)
+                try:
+                    stat = os.stat(fname)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime,stat.st_size,fname))
+        return sorted(entries)
+
+    def trim(self):
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        for mtime,entry_size,fname in entries:
+            if size <= self.size_limit:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            size -= entry_size
+            logger.info("cache: removed %s" %os.path.basename(fname))
+
+    def invalidate(self,key):
+        try:
+            os.remove(self.filename(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Deletes all the entries"""
+        if os.path.isdir(self.directory):
+            for mtime,size,fname in self.entries():
+                self.invalidate(os.path.basename(fname)[:-4])
+
+def Poisson_Schrodinger(model,settings=None,guess=None,cache=None,refresh=False,checkpoint=None,events=None):
+    """aestimo.Poisson_Schrodinger through the cache: returns the stored
+    Results of the structure if it has been solved before with the same
+    settings, otherwise solves it and stores the Results.
+    cache - a ResultCache, None for the one of config.py, False (or
+        config.cache = False) to solve without the cache.
+    refresh - solve again and replace the stored Results.
+    checkpoint, events - see aestimo.Poisson_Schrodinger.
+    Only converged Results are stored: they don't depend on max_iterations
+    (which is not part of the key, a sweep lowers it for the starts from a
+    guess), nor on where the loop started within the convergence test."""
+    if settings is None:
+        settings = aestimo.Settings()
+    if cache is None:
+        cache = ResultCache() if config.cache else False
+    if cache is False:
+        return aestimo.Poisson_Schrodinger(model,settings,guess,checkpoint,events=events)
+    time0 = time.time()
+    key = cache.key(model,settings)
+    if not refresh:
+        result = cache.get(key)
+        if result is not None:
+            result.cached = True # the timing is of the stored calculation, see aestimo.save_timing
+            result.lookup_time = time.time()-time0
+            logger.info("cache hit %s (%g s)" %(key[:16],result.lookup_time))
+            if events is None:
+                events = aestimo.Events(aestimo.QUIET,aestimo.QUIET) if settings.messagesoff else aestimo.Events()
+            events.emit(aestimo.PROGRESS,'cached',"Results read from the cache (%s)" %cache.filename(key),
+                        fname=cache.filename(key))
+            return result
+    result = aestimo.Poisson_Schrodinger(model,settings,guess,checkpoint,events=events)
+    if result.converged:
+        cache.put(key,result)
+        logger.info("cache: stored %s" %key[:16])
+    return result
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  Compiled versions (numba, nopython mode) of the inner loops of
+               aestimo.py: psi_at_inf, psi_at_inf_batch, wf and sturm_count.
+               The loops are the same as in aestimo.py, only the arrays must
+               be numpy arrays.
+               Importing this module raises ImportError if numba is not
+               installed, aestimo then keeps its pure python functions.
+               Compiled code is cached on disk (__pycache__), so the compile
+               cost is only paid on the first run; warmup() loads or compiles
+               every kernel at once.
+"""
+import numpy as np
+import numba
+
+hbar = 1.054588757e-34
+
+@numba.njit(cache=True)
+def psi_at_inf(E,fis,cb_meff,n_max,dx):
+    """Shooting method for heterostructure as given in Harrison's book
+    (on a grid with spacing dx[j] between points j and j+1)"""
+    psi0 = 0.0
+    psi1 = 1.0
+    psi2 = 0.0
+    for j in range(1,n_max-1): # Last potential not used
+        c0=(dx[j-1]+dx[j])/hbar**2
+        c1=2.0/(cb_meff[j]+cb_meff[j-1])/dx[j-1]
+        c2=2.0/(cb_meff[j]+cb_meff[j+1])/dx[j]
+        psi2=((c0*(fis[j]-E)+c2+c1)*psi1-c1*psi0)/c2
+        psi0=psi1
+        psi1=psi2
+    return psi2
+
+@numba.njit(cache=True)
+def psi_at_inf_batch(energies,fis,cb_meff,n_max,dx):
+    """psi_at_inf for each energy of an array"""
+    y = np.empty(energies.shape[0])
+    for k in range(energies.shape[0]):
+        y[k] = psi_at_inf(energies[k],fis,cb_meff,n_max,dx)
+    return y
+
+@numba.njit(cache=True)
+def wf(E,fis,cb_meff,n_max,dx):
+    """Normalised envelope function (units dx**0.5) for the energy E"""
+    w = np.empty(n_max) # width of each point
+    w[0] = dx[0]
+    for j in range(1,n_max):
+        w[j] = (dx[j-1]+dx[j])/2.0
+    b = np.zeros(n_max)
+    b[1] = 1.0
+    N = w[1] # Normalization integral
+    for j in range(1,n_max-1):
+        c0=2.0*w[j]/hbar**2
+        c1=2.0/(cb_meff[j]+cb_meff[j-1])/dx[j-1]
+        c2=2.0/(cb_meff[j]+cb_meff[j+1])/dx[j]
+        b[j+1] = ((c0*(fis[j]-E)+c2+c1)*b[j]-c1*b[j-1])/c2
+        N += b[j+1]**2*w[j+1]
+    for j in range(n_max):
+        b[j] *= (w[j]/N)**0.5
+    return b
+
+@numba.njit(cache=True)
+def sturm_count(energies,diag,offdiag):
+    """Number of eigenvalues of the tridiagonal Hamiltonian below each energy"""
+    count = np.zeros(energies.shape[0],dtype=np.int64)
+    for k in range(energies.shape[0]):
+        E = energies[k]
+        p = diag[0] - E
+        count[k] += p < 0.0
+        for j in range(1,diag.shape[0]):
+            if p == 0.0: # a zero pivot gives -inf, then the sequence carries on
+                p = -np.inf
+            else:
+                p = (diag[j] - E) - offdiag[j-1]**2/p
+            count[k] += p < 0.0
+    return count
+
+def warmup():
+    """Loads (or compiles, on the first run) every kernel for the argument
+    types used by aestimo, so that no compilation happens inside the
+    self-consistent loop."""
+    n = 8
+    x = np.ones(n)
+    dx = np.full(n,1e-10)
+    psi_at_inf(0.0,x,x,n,dx)
+    psi_at_inf_batch(np.zeros(2),x,x,n,dx)
+    wf(0.0,x,x,n,dx)
+    sturm_count(np.zeros(2),x,x[1:])
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  Parameter sweeps. The structure of an input file is solved
+               for every point of a grid of parameter values, the points
+               being spread over a pool of worker processes:
+
+                   table = aestimo_sweep.sweep(inputfile,{'layer1.thickness':[8,12,16],
+                                                          'Fapplied':[0.0,1e6]})
+
+               The parameters are named as
+                   'layerK.thickness', 'layerK.alloy', 'layerK.doping' - a
+                       column of layer K of the material list (also
+                       'layerK.material', 'layerK.type', 'layerK.spacing')
+                   'Material.property' - a database value, e.g.
+                       'GaAs.epsilonStatic' or 'AlGaAs.Bowing_param'
+                   anything else - a value of the input file, e.g.
+                       'Fapplied', 'T', 'gridfactor', 'subnumber_e'
+               iter_sweep yields the results of the points as they finish,
+               sweep collects them into a SweepResults table in the order of
+               the grid. A point that raises an error or runs out of time
+               (timeout, seconds) is recorded as such and the sweep carries
+               on. Points solved before are read from the result cache when it
+               is on (see aestimo_cache and config.cache). Scripts using a pool of processes must call the sweep
+               under "if __name__ == '__main__':".
+"""
+import itertools
+import copy
+import os
+import signal
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor,as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import database
+import aestimo
+import aestimo_cache
+from aestimo import logger
+
+layer_columns = {'thickness':0,'material':1,'alloy':2,'doping':3,'type':4,'spacing':5}
+
+def input_dict(inputfile):
+    """The values of an input file module (or dict) as a plain dict, which
+    can be sent to the worker processes"""
+    if isinstance(inputfile,dict):
+        values = dict(inputfile)
+    else:
+        values = dict((key,value) for key,value in vars(inputfile).items()
+                      if not key.startswith('_') and not callable(value) and not hasattr(value,'__file__'))
+    values['material'] = [list(layer) for layer in values['material']]
+    return values
+
+def apply_point(values,db,names,point):
+    """Input values and database of one point of the sweep. values is the
+    input_dict of the input file, db the database module (or object); they
+    are copied where a parameter changes them."""
+    values = dict(values)
+    values['material'] = [list(layer) for layer in values['material']]
+    copied = False
+    for name,value in zip(names,point):
+        if name.startswith('layer') and '.' in name:
+            k,column = name[5:].split('.',1)
+            layer = values['material'][int(k)]
+            column = layer_columns[column]
+            while len(layer) <= column: # the optional spacing
+                layer.append(None)
+            layer[column] = value
+        elif '.' in name:
+            matType,prop = name.split('.',1)
+            if not copied:
+                db = aestimo.AttrDict(materialproperty=copy.deepcopy(db.materialproperty),
+                                      alloyproperty=copy.deepcopy(db.alloyproperty))
+                copied = True
+            if matType in db.materialproperty:
+                db.materialproperty[matType][prop] = value
+            elif matType in db.alloyproperty:
+                db.alloyproperty[matType][prop] = value
+            else:
+                raise KeyError("%s is not in the database" %matType)
+        else:
+            values[name] = value
+    return values,db
+
+# input values that are plain attributes of a Structure
+structure_names = {'Fapplied':'Fapp','T':'T','subnumber_e':'subnumber_e'}
+
+def build_model(values,db,names,point,base=None):
+    """The Structure of one point of the sweep. If the point only changes
+    layers (and Fapplied, T or subnumber_e), it is a copy of base (the
+    Structure of the input file) with those layers re-rasterized by
+    Structure.update_layer, without building the grid and the arrays again;
+    otherwise the structure is built afresh from apply_point."""
+    if base is None or not all([(name.startswith('layer') and '.' in name) or name in structure_names
+                                for name in names]):
+        values,db = apply_point(values,db,names,point)
+        return aestimo.StructureFrom(values,db)
+    model = base.copy()
+    layers = {} # the changed layers, each updated once
+    for name,value in zip(names,point):
+        if name in structure_names:
+            setattr(model,structure_names[name],value)
+            continue
+        k,column = name[5:].split('.',1)
+        layer = layers.setdefault(int(k),list(model.material[int(k)]))
+        column = layer_columns[column]
+        while len(layer) <= column: # the optional spacing
+            layer.append(None)
+        layer[column] = value
+    for k,layer in sorted(layers.items()):
+        if layer != model.material[k]:
+            model.update_layer(k,layer)
+    return model
+
+class SweepTimeout(Exception):
+    pass
+
+def _alarm(signum,frame):
+    raise SweepTimeout()
+
+# the sweep's input, settings and timeout in a worker process (set by init_worker)
+_worker = {}
+
+pool_restarts = 3 # crashes of a sweep's pool before every remaining group gets a process of its own
+
+def init_worker(values,db,names,settings,timeout,refine):
+    _worker.clear()
+    _worker.update(values=values,db=db,names=names,settings=settings,timeout=timeout,refine=refine)
+
+def solve(point,guess=None):
+    """Solves one point of the sweep (in a worker process), starting from
+    guess (Results) if given. Returns a dict with the results and the status
+    of the point, errors are caught, and the Results (None if it failed).
+    A start from a guess is given up (not converged) after twice the
+    iterations the guess took, plus a few."""
+    w = _worker
+    settings = w['settings']
+    if guess is not None:
+        settings = copy.copy(settings)
+        settings.max_iterations = min(settings.max_iterations,2*guess.iteration+4)
+    record = {'status':'ok','error':'','warm':guess is not None}
+    result = None
+    time0 = time.time()
+    alarm = w['timeout'] and hasattr(signal,'SIGALRM')
+    if alarm:
+        signal.signal(signal.SIGALRM,_alarm)
+        signal.setitimer(signal.ITIMER_REAL,w['timeout'])
+    try:
+        if 'base' not in w: # the unchanged input, built once per worker
+            try:
+                w['base'] = aestimo.StructureFrom(w['values'],w['db'])
+            except ValueError: # e.g. too many grid points, the points are then built one by one
+                w['base'] = None
+        model = build_model(w['values'],w['db'],w['names'],point,w['base'])
+        result = aestimo_cache.Poisson_Schrodinger(model,settings,guess)
+        record.update(E_state=list(result.E_state),N_state=list(result.N_state),
+                      meff_state=list(result.meff_state),E_F=result.E_F,
+                      iteration=result.iteration,converged=result.converged,n_max=model.n_max)
+    except SweepTimeout:
+        record.update(status='timeout',error='longer than %g s' %w['timeout'])
+    except Exception as error:
+        record.update(status='error',error='%s: %s' %(type(error).__name__,error))
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL,0)
+    record['calctime'] = time.time()-time0
+    record['total_iterations'] = record.get('iteration',0)
+    return record,result
+
+def midpoint(a,b):
+    """The point halfway between the points a and b, None if there is none
+    (a value that isn't a number, or integers next to each other)"""
+    mid = []
+    for x,y in zip(a,b):
+        if x == y:
+            mid.append(x)
+        elif isinstance(x,(int,np.integer)) and isinstance(y,(int,np.integer)):
+            if abs(x-y) < 2:
+                return None
+            mid.append((x+y)//2)
+        elif isinstance(x,(int,float,np.number)) and isinstance(y,(int,float,np.number)):
+            mid.append((x+y)/2.0)
+        else:
+            return None
+    return tuple(mid)
+
+def extrapolate(before,previous,point):
+    """Guess for point from the (point,Results) of the two converged points
+    before it in a chain: the potential and the energies extrapolated
+    linearly in the last parameter (secant predictor). None if that
+    parameter isn't a number."""
+    x0,x1,x2 = before[0][-1],previous[0][-1],point[-1]
+    if not all([isinstance(x,(int,float,np.number)) for x in (x0,x1,x2)]) or x1 == x0:
+        return None
+    t = float(x2-x1)/float(x1-x0)
+    r0,r1 = before[1],previous[1]
+    V0 = r0.V if len(r0.xaxis) == len(r1.xaxis) and np.array_equal(r0.xaxis,r1.xaxis) else np.interp(r1.xaxis,r0.xaxis,r0.V)
+    return aestimo.Results(xaxis=r1.xaxis,V=r1.V+t*(r1.V-V0),wfe=r1.wfe,iteration=r1.iteration,
+                           E_state=list(np.asarray(r1.E_state)+t*(np.asarray(r1.E_state)-np.asarray(r0.E_state))))
+
+def continue_to(previous,point,refine,cold=True,guess=None):
+    """Solves point starting from previous, the (point,Results) of a
+    converged neighbour (or from guess, e.g. extrapolated, if given). If
+    that fails to converge, the step is halved through an intermediate point
+    (refine times at most, giving up as soon as an intermediate point
+    fails); the last resort (cold) is a start from V = 0."""
+    if previous is None:
+        return solve(point)
+    record,result = solve(point,guess or previous[1])
+    if record['status'] == 'timeout' or (record['status'] == 'ok' and record['converged']):
+        return record,result
+    total = record['total_iterations']
+    mid = midpoint(previous[0],point)
+    if refine > 0 and mid is not None:
+        logger.info("Continuation to %s failed, halving the step" %(point,))
+        mid_record,mid_result = continue_to(previous,mid,refine-1,cold=False)
+        total += mid_record['total_iterations']
+        if mid_record['status'] == 'ok' and mid_record['converged']:
+            record,result = continue_to((mid,mid_result),point,refine-1,cold=False)
+            record['total_iterations'] += total
+            if record['status'] == 'ok' and record['converged']:
+                return record,result
+            total = record['total_iterations']
+    if cold:
+        logger.info("Continuation to %s failed, starting from V = 0" %(point,))
+        record,result = solve(point)
+        record['total_iterations'] += total
+    else:
+        record['total_iterations'] = total
+    return record,result
+
+def iter_group(indices,points):
+    """Solves a group of points of the sweep, yielding (index,record) for
+    each. A group of more than one point is a chain of neighbours for
+    continuation: each point starts from the last converged one, or from
+    the extrapolation of the last two."""
+    before = previous = None # (point,Results) of the last two converged points
+    for index,point in zip(indices,points):
+        if len(indices) > 1:
+            guess = extrapolate(before,previous,point) if before else None
+            record,result = continue_to(previous,point,_worker['refine'],guess=guess)
+        else:
+            record,result = solve(point)
+        if record['status'] == 'ok' and record['converged']:
+            before,previous = previous,(point,result)
+        else: # the next point continues from the last converged one
+            before = None
+        yield index,record
+
+def solve_group(indices,points):
+    """iter_group as a list, in a worker process"""
+    return list(iter_group(indices,points))
+
+def iter_sweep(inputfile,parameters,settings=None,processes=None,timeout=None,db=database,
+               continuation=False,refine=2):
+    """Solves the input file (module or dict) at every point of the grid of
+    parameters (dict: name -> list of values, see the module description)
+    and yields (index,point,record) as the points finish. record is the dict
+    of solve. processes - number of worker processes (default: all the
+    cores; 1 solves in this process). timeout - seconds per point.
+    continuation - each run of the last parameter (the others fixed) is
+    solved in order by one worker, every point starting from the potential
+    and states of the previous one. A point that doesn't converge from its
+    neighbour is reached in smaller steps (halved up to refine times) or
+    else solved from scratch. Use it for dense sweeps with small steps.
+    A worker process that dies takes its pool down. The groups that were
+    in the workers then are solved again one worker process each, so that
+    only the point (chain) that kills its worker is recorded as 'crashed',
+    and the others go on in a fresh pool (after pool_restarts crashes every
+    remaining group gets a process of its own)."""
+    if settings is None:
+        settings = aestimo.Settings(messagesoff=True)
+    names = list(parameters)
+    points = list(itertools.product(*[parameters[name] for name in names]))
+    db = aestimo.AttrDict(materialproperty=db.materialproperty,alloyproperty=db.alloyproperty) # a module can't be pickled
+    initargs = (input_dict(inputfile),db,names,settings,timeout,refine)
+    if continuation and names:
+        chain = len(parameters[names[-1]]) # the last parameter varies fastest in the grid
+        groups = [list(range(start,start+chain)) for start in range(0,len(points),chain)]
+    else:
+        groups = [[index] for index in range(len(points))]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    logger.info("Sweep of %d points over %s, %d processes%s" %(len(points),', '.join(names),processes,
+                ', continuation' if continuation else ''))
+    if processes == 1:
+        init_worker(*initargs)
+        for group in groups:
+            for index,record in iter_group(group,[points[index] for index in group]):
+                yield index,points[index],record
+        return
+    pending = list(groups) # in the order of submission
+    restarts = 0
+    while pending:
+        try:
+            with ProcessPoolExecutor(min(processes,len(pending)),initializer=init_worker,initargs=initargs) as executor:
+                futures = dict((executor.submit(solve_group,group,[points[index] for index in group]),group) for group in pending)
+                for future in as_completed(futures):
+                    records = future.result()
+                    pending.remove(futures[future])
+                    for index,record in records:
+                        yield index,points[index],record
+        except BrokenProcessPool:
+            restarts += 1
+            # the pool hands out the groups in order, one to each worker and one queued,
+            # so the group that crashed is among the first unfinished ones
+            suspects = pending[:processes+1] if restarts <= pool_restarts else list(pending)
+            logger.warning("A sweep worker died, solving %d point(s) one process each, %d in a fresh pool"
+                           %(sum([len(group) for group in suspects]),sum([len(group) for group in pending])
+                             -sum([len(group) for group in suspects])))
+            for index,point,record in iter_isolated(suspects,points,processes,initargs):
+                yield index,point,record
+            pending = pending[len(suspects):]
+
+def iter_isolated(groups,points,processes,initargs):
+    """Solves every group in a worker process of its own, processes at a
+    time, recording the points of a group whose process dies as 'crashed'"""
+    for start in range(0,len(groups),processes):
+        batch = groups[start:start+processes]
+        executors = [ProcessPoolExecutor(1,initializer=init_worker,initargs=initargs) for group in batch]
+        try:
+            futures = dict((executor.submit(solve_group,group,[points[index] for index in group]),group)
+                           for executor,group in zip(executors,batch))
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    records = future.result()
+                except BrokenProcessPool:
+                    records = [(index,{'status':'crashed','error':'the worker process died','calctime':np.nan}) for index in group]
+                    logger.error("Sweep point(s) %s crashed the worker process" %([points[index] for index in group],))
+                for index,record in records:
+                    yield index,points[index],record
+        finally:
+            for executor in executors:
+                executor.shutdown()
+
+class SweepResults():
+    """Results of a sweep, one row per point in the order of the grid:
+    names - the swept parameters, parameters - dict name -> array of values
+    E_state (meV), N_state (m**-2), meff_state (kg) - arrays (points,
+        subbands), nan for missing values
+    E_F (meV), iteration, total_iterations, converged, n_max, calctime (s) - arrays
+    status - 'ok', 'error', 'timeout' or 'crashed', error - the message"""
+    def __init__(self,names,points,records):
+        self.names = names
+        self.parameters = dict((name,np.array([point[k] for point in points]))
+                               for k,name in enumerate(names))
+        nsub = max([len(record.get('E_state',())) for record in records]+[0])
+        def table(key,width=None):
+            if width is None:
+                return np.array([record.get(key,np.nan) for record in records],dtype=float)
+            rows = np.full((len(records),width),np.nan)
+            for row,record in zip(rows,records):
+                values = record.get(key,())
+                row[:len(values)] = values
+            return rows
+        self.E_state = table('E_state',nsub)
+        self.N_state = table('N_state',nsub)
+        self.meff_state = table('meff_state',nsub)
+        self.E_F = table('E_F')
+        self.iteration = table('iteration')
+        self.total_iterations = table('total_iterations') # including the intermediate points of continuation
+        self.converged = table('converged')
+        self.n_max = table('n_max')
+        self.calctime = table('calctime')
+        self.status = np.array([record['status'] for record in records])
+        self.error = [record['error'] for record in records]
+
+    def save(self,fname):
+        """Writes the table as text, one line per point"""
+        nsub = self.E_state.shape[1]
+        header = self.names+['status','E_F(meV)','iterations']+["E%d(meV)" %j for j in range(nsub)]+["N%d(m**-2)" %j for j in range(nsub)]
+        fobj = open(fname,'w')
+        fobj.write(' '.join(header)+'\n')
+        for i in range(len(self.status)):
+            row = [str(self.parameters[name][i]) for name in self.names]+[self.status[i]]
+            row += ['%.6e' %self.E_F[i],'%g' %self.iteration[i]]
+            row += ['%.6e' %value for value in np.concatenate((self.E_state[i],self.N_state[i]))]
+            fobj.write(' '.join(row)+'\n')
+        fobj.close()
+
+def sweep(inputfile,parameters,settings=None,processes=None,timeout=None,db=database,callback=None,
+          continuation=False,refine=2):
+    """Runs iter_sweep and collects the results in a SweepResults table.
+    callback(index,point,record) is called as each point finishes."""
+    names = list(parameters)
+    points = list(itertools.product(*[parameters[name] for name in names]))
+    records = [None]*len(points)
+    for index,point,record in iter_sweep(inputfile,parameters,settings,processes,timeout,db,continuation,refine):
+        records[index] = record
+        if record['status'] != 'ok':
+            logger.warning("Sweep point %s: %s %s" %(point,record['status'],record['error']))
+        if callback:
+            callback(index,point,record)
+    return SweepResults(names,points,records)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  Benchmark suite, to follow the speed (and the results) of the
+               solver from one change to the next:
+
+                   python benchmark.py --save baseline.json
+                   ... change the code ...
+                   python benchmark.py --baseline baseline.json
+
+               Every sample structure is solved for each gridfactor,
+               computation scheme and subnumber_e (see --help to choose them),
+               without the cache, plots or output files. For each case it
+               reports the wall time (best of --repeat runs, made in turns
+               over all the cases), the iterations,
+               the psi_at_inf calls, the peak memory (tracemalloc, in a
+               separate run, which takes most of the time of the suite) and
+               E_state and E_F. With --baseline, a case
+               slower than the baseline by more than --threshold, or with
+               other results (iterations, or energies beyond --tolerance), is
+               flagged and the exit status is 1.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import database
+import aestimo
+from main import load_inputfile,parse_value
+
+samples = ['sample-qw-qwdope','sample-qw-barrierdope','sample-moddop']
+
+def run_case(values,settings):
+    """Solves the input values once, returns the record of the case"""
+    model = aestimo.StructureFrom(values,database)
+    time0 = time.perf_counter()
+    result = aestimo.Poisson_Schrodinger(model,settings)
+    calctime = time.perf_counter() - time0
+    timing = result.timing
+    return {'n_max':model.n_max,'time':calctime,'iterations':result.iteration,
+            'converged':result.converged,
+            'psi_at_inf':sum(row['psi_at_inf'] for row in timing),
+            'psi_at_inf_batch_energies':sum(row['psi_at_inf_batch_energies'] for row in timing),
+            'newton_steps':sum(sum(row['newton_steps']) for row in timing),
+            'E_state':[float(E) for E in result.E_state],'E_F':float(result.E_F)}
+
+def reference_time():
+    """Time (s) of a fixed piece of work (python loop and numpy), to tell the
+    speed of the machine at the time of the run from the speed of the code"""
+    time0 = time.perf_counter()
+    x = 0.0
+    for j in range(200000):
+        x = 0.5*x + j
+    a = np.random.RandomState(0).rand(200,200)
+    for j in range(20):
+        a = np.dot(a,a)/200.0
+    return time.perf_counter() - time0
+
+def peak_memory(values,settings):
+    """Peak memory (MB) allocated while solving the input values (slow,
+    tracemalloc traces every allocation)"""
+    tracemalloc.start()
+    aestimo.Poisson_Schrodinger(aestimo.StructureFrom(values,database),settings)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak/1e6
+
+def case_name(case):
+    return "%s dx=%g scheme=%d subnumber_e=%d" %(case['sample'],case['gridfactor'],case['scheme'],case['subnumber_e'])
+
+def compare(cases,baseline,threshold,tolerance,min_time=2e-3,scale=1.0):
+    """The regressions of cases against the cases of baseline, as text lines:
+    slower by more than threshold (relative) and min_time (s), more
+    psi_at_inf calls (by threshold), more iterations, no longer converged, or energies changed by more than
+    tolerance (meV). The times of the baseline are multiplied by scale (the
+    ratio of the speeds of the machine)."""
+    previous = dict((case_name(case),case) for case in baseline['cases'])
+    regressions = []
+    for case in cases:
+        name = case_name(case)
+        if name not in previous:
+            continue
+        old = dict(previous[name])
+        old['time'] *= scale
+        if case['time'] > old['time']*(1.0+threshold) and case['time']-old['time'] > min_time:
+            regressions.append("%s: %.4g s, baseline %.4g s (%+.0f%%)" %(name,case['time'],old['time'],
+                                                                        100.0*(case['time']/old['time']-1.0)))
+        if case['psi_at_inf'] > old['psi_at_inf']*(1.0+threshold):
+            regressions.append("%s: %d psi_at_inf calls, baseline %d" %(name,case['psi_at_inf'],old['psi_at_inf']))
+        if case['iterations'] > old['iterations'] or (old['converged'] and not case['converged']):
+            regressions.append("%s: %d iterations, baseline %d" %(name,case['iterations'],old['iterations']))
+        dE = max([abs(case['E_F']-old['E_F'])]+[abs(E-E0) for E,E0 in zip(case['E_state'],old['E_state'])])
+        if dE > tolerance:
+            regressions.append("%s: energies differ from the baseline by %.3g meV" %(name,dE))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aestimo benchmark suite")
+    parser.add_argument('--samples',nargs='+',default=samples)
+    parser.add_argument('--gridfactors',nargs='+',type=float,default=[0.5,0.1,0.02],help="grid steps (nm)")
+    parser.add_argument('--schemes',nargs='+',type=int,default=[0,2],help="computation schemes")
+    parser.add_argument('--subnumbers',nargs='+',type=int,default=[1,2,3],help="subnumber_e values")
+    parser.add_argument('-s','--set',action='append',default=[],metavar='NAME=VALUE',
+                        help="a solver setting of config.py, e.g. eigensolver=matrix")
+    parser.add_argument('--repeat',type=int,default=5,help="runs of each case, the fastest is reported")
+    parser.add_argument('--no-memory',action='store_true',help="don't measure the peak memory (quicker)")
+    parser.add_argument('--save',metavar='FILE',help="write the results (json), e.g. as a baseline")
+    parser.add_argument('--baseline',metavar='FILE',help="compare with the results saved in FILE")
+    parser.add_argument('--threshold',type=float,default=0.25,help="relative slow down flagged as a regression")
+    parser.add_argument('--tolerance',type=float,default=1e-3,help="change of the energies (meV) flagged")
+    args = parser.parse_args(argv)
+
+    settings = dict(messagesoff=True)
+    for item in args.set:
+        name,sep,value = item.partition('=')
+        settings[name] = parse_value(value)
+    settings = aestimo.Settings(**settings)
+
+    # warming up: the first calculation loads (or compiles) the numba kernels
+    values = load_inputfile(args.samples[0])
+    for k in range(5):
+        aestimo.Poisson_Schrodinger(aestimo.StructureFrom(values,database),settings)
+
+    reference = reference_time()
+    cases = []
+    inputs = []
+    for sample in args.samples:
+        inputvalues = load_inputfile(sample)
+        for gridfactor in args.gridfactors:
+            for scheme in args.schemes:
+                for subnumber_e in args.subnumbers:
+                    values = dict(inputvalues,gridfactor=gridfactor,computation_scheme=scheme,subnumber_e=subnumber_e)
+                    case = dict(sample=sample,gridfactor=gridfactor,scheme=scheme,subnumber_e=subnumber_e)
+                    try:
+                        case.update(run_case(values,settings))
+                    except ValueError as error: # e.g. too many grid points
+                        print ("%-55s %s" %(case_name(case),error))
+                        continue
+                    cases.append(case)
+                    inputs.append(values)
+    # the repeats go round all the cases, so that a slow spell of the machine
+    #doesn't spoil all the runs of one case
+    for k in range(args.repeat-1):
+        reference = min(reference,reference_time())
+        for case,values in zip(cases,inputs):
+            case['time'] = min(case['time'],run_case(values,settings)['time'])
+    for case,values in zip(cases,inputs):
+        case['peak_memory'] = None if args.no_memory else peak_memory(values,settings)
+
+    print ("%-55s %6s %9s %5s %9s %8s  %s" %("case","n_max","time (s)","iter","psi_at_inf","mem (MB)","E_state (meV), E_F (meV)"))
+    for case in cases:
+        print ("%-55s %6d %9.4g %5d %9d %8s  %s, %.6f%s" %(case_name(case),case['n_max'],case['time'],
+               case['iterations'],case['psi_at_inf'],
+               '-' if case['peak_memory'] is None else '%.3g' %case['peak_memory'],
+               ", ".join(["%.6f" %E for E in case['E_state']]),case['E_F'],
+               "" if case['converged'] else " (not converged)"))
+
+    report = {'python':platform.python_version(),'numpy':np.__version__,'platform':platform.platform(),
+              'jit':aestimo.aestimo_numba is not None,
+              'settings':dict((name,getattr(settings,name)) for name in settings.names),
+              'reference_time':reference,'cases':cases}
+    if args.save:
+        with open(args.save,'w') as fobj:
+            json.dump(report,fobj,indent=1)
+    if args.baseline:
+        with open(args.baseline) as fobj:
+            baseline = json.load(fobj)
+        scale = reference/baseline['reference_time'] if baseline.get('reference_time') else 1.0
+        print ("Machine speed: reference work %.4g s, baseline %.4g s" %(reference,baseline.get('reference_time',reference)))
+        regressions = compare(cases,baseline,args.threshold,args.tolerance,scale=scale)
+        names = set(case_name(case) for case in baseline['cases'])
+        total = sum(case['time'] for case in cases if case_name(case) in names)
+        total0 = scale*sum(case['time'] for case in baseline['cases'] if case_name(case) in set(map(case_name,cases)))
+        print ("Total time of the cases in the baseline %.4g s, baseline %.4g s (%+.0f%%)" %(total,total0,100.0*(total/total0-1.0)))
+        if total > total0*(1.0+args.threshold):
+            regressions.append("total time %.4g s, baseline %.4g s" %(total,total0))
+        for line in regressions:
+            print ("REGRESSION",line)
+        if regressions:
+            return 1
+        print ("No regressions against %s" %args.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -36,36 +36,77 @@ inputfilename = "sample-qw-qwdope"
 
 # Calculation
 # -----------
+# Schrödinger solver
+#  'shooting' : energy scan and Newton-Raphson on psi_at_inf (Harrison's book)
+#  'matrix'   : the same finite difference Hamiltonian as a symmetric tridiagonal
+#               matrix, lowest subnumber_e states in one LAPACK call (needs scipy).
+#  'sparse'   : shift-invert Lanczos (ARPACK) on the same Hamiltonian for the few
+#               states above the potential minimum, for very large grids (needs scipy).
+eigensolver = 'shooting'
 # Shooting method parameters for Schrödinger Equation solution
 delta_E = 0.5*meV2J #Energy step (Joules) for initial search. Initial delta_E is 1 meV. 
 d_E = 1e-5*meV2J #Energy step (Joules) within Newton-Raphson method when improving the precision of the energy of a found level.
+shooting_batch = 64 #Number of trial energies marched through the grid together in the initial search (1: one energy at a time).
+bracketing = 'scan' #How the shooting method brackets each state: 'scan' steps up in delta_E from the previous state,
+                    #'sturm' bisects on the number of states below an energy (Sturm sequence), so close levels are never skipped.
+warmstart = True #In the self-consistent loop, look for each state close to its energy of the previous iteration first
+                 #(sparse eigensolver: start Lanczos from the previous wavefunctions).
+warmstart_window = 1.0*meV2J #Half width (Joules) of the bracket around the previous energy, the full search is used if it fails.
 E_start = 0.0    #Energy to start shooting method from (if E_start = 0.0 uses minimum of energy of bandstructure)
 Estate_convergence_test = 1e-9*meV2J
+# Subbands
+auto_subbands = False #True: the subnumber_e of the input file is only the starting number of subbands, states are added while
+                      #the highest one is below E_F + subband_cutoff*kT and the empty ones above the first such state are dropped.
+                      #The shooting method then brackets the states by their count, as with bracketing = 'sturm'.
+subband_cutoff = 10.0 #kT above the Fermi level beyond which a subband is taken as empty.
+max_subbands = 40 #the automatic number of subbands never goes beyond it.
 # FermiDirac
-FD_d_E = 1e-9 #Initial and minimum Energy step (meV) for derivative calculation for Newton-Raphson method to find E_F
-FD_convergence_test = 1e-6 #meV
+FD_convergence_test = 1e-6 #meV, accuracy of the Fermi level
 np_d_E = 1.0 # Energy step (meV) for dispersion calculations
+# Compiled kernels
+jit = True #Use numba compiled kernels for the inner loops when numba is installed (otherwise pure python).
 # Poisson Loop
+poisson_update = 'fixedpoint' #'fixedpoint': the potential of the last charge distribution, combined with the previous one by mixing.
+                             #'predictor': predictor-corrector, the Poisson equation is solved (Newton) with the charge and the
+                             #Fermi level following the potential, subbands shifted locally; the predicted potential is taken
+                             #with a full step, always with 'anderson' mixing whatever the mixing below (a stall falls back to a
+                             #damped fixed point step).
+                             #Structures without electrons (undoped, p-type) always take the fixed point step.
 damping = 0.5    #averaging factor between iterations to smooth convergence.
+mixing = 'linear' #'linear': V = V + damping*(Vnew - V) at each iteration.
+                    #'anderson': Anderson/Pulay (DIIS) mixing, combines the last mixing_history iterations to cancel
+                    #the residual Vnew - V; falls back to one linear step (and restarts) when the residual grows.
+mixing_history = 5 #number of previous iterations kept by the Anderson mixing.
 max_iterations=80 #maximum number of iterations.
 convergence_test=1e-6 #convergence is reached when the ground state energy (meV) is stable to within this number between iterations.
+checkpoint_interval = 5 #iterations between the checkpoints of the loop, when one is asked for (main.py --checkpoint), 0: only at the end.
+# Result cache
+cache = False #True: read a structure solved before with the same settings back from cache_directory instead of solving it again.
+cache_directory = "cache"
+cache_size_limit = 200 #MB, the least recently used results are deleted beyond it.
 
 
 # Output Files
 # ------------
 output_directory = "outputs"
+output_format = 'text' #'text': the .dat files below, 'binary': .npy arrays with a results.json that describes them
+                       #(fast to write, wavefunctions can be read memory mapped), 'both'.
 parameters = True
 electricfield_out = True
 potential_out = True
 sigma_out = True
 probability_out = True
 states_out = True
+timing_out = True #timing.json and timing.csv: time spent in each phase of each iteration, psi_at_inf calls, Newton steps
 
 # Result Viewer
 # -------------
-resultviewer = True
+resultviewer = True # True: show the figures, 'file': write them to results.png and qw.png in the background, False: none
+plot_columns = 1000 # the traces are decimated to the lowest and highest point of this many slices of the x axis
 wavefunction_scalefactor = 200 # scales wavefunctions when plotting QW diagrams
 # Messages
 # --------
-messagesoff = False
+messagesoff = False # True: the self-consistent loop neither prints nor logs its messages (only the warnings)
+verbosity = 2 # messages of the self-consistent loop: 0 none, 1 one line per iteration, 2 the states and charges, 3 each subband
+log_verbosity = 2 # the same levels for the log file
 logfile = 'aestimo.log'
\ No newline at end of file
@@ -19,15 +19,168 @@
 
     For the list of contributors, see ~/AUTHORS
 
- Description:  This is the main file.
+ Description:  This is the main file, the command line interface:
+
+                   python main.py sample-qw-qwdope.py sample-moddop.py --headless
+                   python main.py sample-moddop --set Fapplied=1e6 --set eigensolver=matrix
+
+               Solves each input file (a path, or a module name as in
+               config.inputfilename, which is used when none is given) in
+               this process. --set overrides a solver setting or an option
+               of config.py (e.g. cache=True) or a value of the input files. --headless writes the results
+               without plotting, matplotlib is then never imported;
+               --render writes the figures to image files in a background
+               process, the next input file is solved meanwhile. With
+               several input files the results of each go to a folder of
+               its own in the output directory.
 """
-import matplotlib.pyplot as pl
-import numpy as np
 import time
-#import sys 
+time0 = time.time() # timing audit, startup
+import argparse
+import ast
+import importlib
+import logging
+import os
+import sys
 
 import config
+import database
 import aestimo
+import aestimo_cache
+
+logger = logging.getLogger('aestimo')
+
+def load_inputfile(name):
+    """The input file as a dict of its values, from a path (.py) or the name of
+    a module that can be imported (e.g. sample-qw-qwdope)"""
+    namespace = {}
+    if os.path.isfile(name):
+        with open(name) as fobj:
+            exec(compile(fobj.read(),name,'exec'),namespace)
+    else:
+        namespace = vars(importlib.import_module(name))
+    return dict((key,value) for key,value in namespace.items()
+                if not key.startswith('_') and not callable(value) and not hasattr(value,'__file__'))
+
+def config_options():
+    """The names of the options of config.py"""
+    return [name for name,value in vars(config).items()
+            if not name.startswith('_') and not callable(value) and not hasattr(value,'__file__')]
 
+def inputfile_names(inputfiles):
+    """The names an input file can set: those read by StructureFrom and the
+    variables of the input files (the ones that can be loaded)"""
+    names = set(aestimo.StructureFrom.names)
+    for name in inputfiles:
+        try:
+            names.update(load_inputfile(name))
+        except (IOError,ImportError,SyntaxError): # reported when it is solved
+            pass
+    return names
+
+def parse_value(text):
+    """A python literal (number, list, True, ...) or else the text itself"""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError,SyntaxError):
+        return text
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Aestimo 1D Schrodinger-Poisson solver")
+    parser.add_argument('inputfiles',nargs='*',
+                        help="input files (paths or module names), default config.inputfilename")
+    parser.add_argument('-s','--set',action='append',default=[],metavar='NAME=VALUE',
+                        help="a solver setting of config.py (e.g. eigensolver=matrix) or a value of "
+                             "the input files (e.g. Fapplied=1e6), may be repeated; an unknown NAME "
+                             "stops with the list of the valid ones")
+    parser.add_argument('-o','--output-directory',default=config.output_directory)
+    parser.add_argument('-f','--format',choices=('text','binary','both'),default=config.output_format,
+                        help="output files: text (.dat), binary (.npy with results.json) or both")
+    parser.add_argument('--headless',action='store_true',
+                        help="don't plot (matplotlib is not imported)")
+    parser.add_argument('--render',action='store_true',
+                        help="write the figures to results.png and qw.png in the output directory, "
+                             "in a background process, instead of showing them")
+    parser.add_argument('--no-cache',action='store_true',help="solve without the result cache")
+    parser.add_argument('--refresh',action='store_true',help="solve again and replace the cached results")
+    parser.add_argument('--checkpoint',action='store_true',
+                        help="save the state of the self-consistent loop to checkpoint.npz in the output "
+                             "directory every config.checkpoint_interval iterations, and resume from it")
+    parser.add_argument('--initial',metavar='CHECKPOINT',
+                        help="start from the potential of a (converged) checkpoint, e.g. of a related structure")
+    parser.add_argument('--log',default=config.logfile,help="log file ('' for none)")
+    parser.add_argument('-q','--quiet',action='store_true',help="no messages during the calculation")
+    parser.add_argument('-v','--verbosity',type=int,choices=range(4),default=config.verbosity,
+                        help="messages of the self-consistent loop: 0 none, 1 one line per iteration, "
+                             "2 the states and charges, 3 each subband")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.log:
+        aestimo.log_to_file(args.log)
+    logger.setLevel(logging.INFO)
+    
+    settings = {'messagesoff':args.quiet or config.messagesoff}
+    overrides = {}
+    options = config_options()
+    inputfiles = args.inputfiles or [config.inputfilename]
+    for item in args.set:
+        name,sep,value = item.partition('=')
+        if not sep:
+            sys.exit("--set needs NAME=VALUE, got %s" %item)
+        if name in aestimo.Settings.names:
+            settings[name] = parse_value(value)
+        elif name in options: # e.g. cache=True, output_format=binary
+            setattr(config,name,parse_value(value))
+        else:
+            overrides[name] = parse_value(value)
+    unknown = [name for name in overrides if name not in inputfile_names(inputfiles)]
+    if unknown:
+        sys.exit("--set: unknown name(s) %s. Valid names are\n  solver settings: %s\n  config.py: %s\n"
+                 "  input files: %s" %(", ".join(unknown),", ".join(aestimo.Settings.names),
+                 ", ".join(name for name in options if name not in aestimo.Settings.names),
+                 ", ".join(sorted(inputfile_names(inputfiles)))))
+    settings = aestimo.Settings(**settings)
+    cache = False if args.no_cache else None
+    if settings.messagesoff: # neither printed nor logged
+        events = aestimo.Events(aestimo.QUIET,aestimo.QUIET)
+    else:
+        events = aestimo.Events(verbosity=args.verbosity)
+    guess = aestimo.load_checkpoint(args.initial) if args.initial else None
     
+    failed = 0
+    for k,name in enumerate(inputfiles):
+        time1 = time.time()
+        try:
+            values = load_inputfile(name)
+            values.update(overrides)
+            model = aestimo.StructureFrom(values,database)
+        except (IOError,ImportError,SyntaxError,KeyError,ValueError) as error:
+            print ("%s: %s" %(name,error))
+            logger.error("%s: %s" %(name,error))
+            failed += 1
+            continue
+        if k == 0:
+            logger.info("startup time (to the first calculation) %g s" %(time.time() - time0))
+        logger.info("inputfile is %s" %name)
+        output_directory = args.output_directory
+        if len(inputfiles) > 1:
+            output_directory = os.path.join(output_directory,os.path.splitext(os.path.basename(name))[0])
+        checkpoint = None
+        if args.checkpoint:
+            if not os.path.isdir(output_directory):
+                os.makedirs(output_directory)
+            checkpoint = os.path.join(output_directory,'checkpoint.npz')
+        result = aestimo_cache.Poisson_Schrodinger(model,settings,guess,cache=cache,refresh=args.refresh,
+                                                   checkpoint=checkpoint,events=events)
+        aestimo.save_and_plot(result,model,output_directory,plot='file' if args.render else False if args.headless else None,
+                             settings=settings,output_format=args.format)
+        print ("%s: E_state (meV) %s, E_F %g meV, %d iterations%s, %.3g s" %(
+               name,", ".join(["%.6g" %E for E in result.E_state]),result.E_F,result.iteration,
+               "" if result.converged else " (not converged)",time.time()-time1))
+    logger.info("total running time %g s" %(time.time() - time0))
+    return 1 if failed else 0
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,54 +22,39 @@
  Description:  This is an example script for simulating a design several 
                times while varying a parameter over a range of values.
 """
-import matplotlib.pyplot as pl
-import numpy as np
 import os
 
 # aestimo modules
 import config
 inputfile = __import__(config.inputfilename) 
-import database
-
-### Example: Parameter to loop over.
-#thickness of first layer of structure
-thicknesses = [8,12,14,16,20] #nm
-
-# first value
-inputfile.material[1][0] = thicknesses[0]
-output_directory = config.output_directory # will be our local copy of the original value
-config.output_directory = os.path.join(output_directory,'dz0_%dnm' %thicknesses[0])
-
-import aestimo # this will run aestimo for the initial time (necessary to do 
-# we want to use the python module reload function)
-
-#the desired results can be stored for further analysis. 
-#e.g.
-results=[aestimo.E_state]
-
-# Looping over the parameter
-"""we vary the (runtime values of the) variables within inputfile module's 
-namespace and then use the reload function on the aestimo module in order 
-to run the simulation afresh for each value. Equally, we could vary the 
-values in the database module if we wanted to."""
-for thickness in thicknesses[1:]:
-    inputfile.material[1][0] = thickness
-    #other examples -
-    #inputfile.Fapplied = ... 
-    #inputfile.subnumber_e = ...
-    #inputfile.gridfactor = ...
-    #database.materialproperty['GaAs']['epsilonStatic']= ...
-    
-    # Set output directory 
-    # aestimo_numpy reads the output directory from the config module, so
-    config.output_directory = os.path.join(output_directory,'dz0_%dnm' %thickness)
-        
-    reload(aestimo) # by reloading the module, we rerun the calculation for the new input parameters
+import aestimo_sweep
+
+### Example: Parameters to loop over.
+#thickness of the layer 1 of the structure (nm)
+parameters = {'layer1.thickness': [8,12,14,16,20]}
+#other examples -
+#parameters['Fapplied'] = [0.0,1e6,2e6] 
+#parameters['layer0.alloy'] = [0.2,0.3]
+#parameters['GaAs.epsilonStatic'] = [12.9,13.1]  # a value in the database
+
+"""Every combination of the values is solved, the points being spread over all
+the cores. The results arrive as the points finish and are then collected
+into one table in the order of the parameters. With continuation=True each
+run of the last parameter is solved in order, every point starting from the
+solution of the previous one."""
+if __name__ == '__main__': # needed by the worker processes
+    def progress(index,point,record):
+        print ("point",point,record['status'],record.get('E_state'))
     
-    #e.g.
-    results.append(aestimo.E_state) #the desired results can be stored for further analysis. 
+    table = aestimo_sweep.sweep(inputfile,parameters,timeout=600.0,callback=progress)
     
-print results
+    if not os.path.isdir(config.output_directory):
+        os.makedirs(config.output_directory)
+    table.save(os.path.join(config.output_directory,'sweep.dat'))
     
-print "Simulation is finished. All files are closed."
-print "Please control the related files."
+    #the desired results can be stored for further analysis, e.g.
+    results = table.E_state
+    print (results)
+        
+    print ("Simulation is finished. All files are closed.")
+    print ("Please control the related files.")
@@ -1,31 +0,0 @@
-"""
- Aestimo EDU 1D Schrodinger-Poisson Solver
- Copyright (C) 2013-2020  Aestimo group
-
-    This program is free software: you can redistribute it and/or modify
-    it under the terms of the GNU General Public License as published by
-    the Free Software Foundation, either version 3 of the License, or
-    (at your option) any later version.
-
-    This program is distributed in the hope that it will be useful,
-    but WITHOUT ANY WARRANTY; without even the implied warranty of
-    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
-    GNU General Public License for more details.
-
-    You should have received a copy of the GNU General Public License
-    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
-
-    For the list of contributors, see ~/AUTHORS
-
- Description:  cProfile file.
-"""
-
-import cProfile
-command = """import main"""
-cProfile.runctx( command, globals(),locals(),filename="aestimo_numpy-0.8.3.profile")
-
-#command = """import aestimo"""
-#cProfile.runctx( command, globals(), locals(), filename="aestimo_t8.profile" )
-
-#command = """import main"""
-#cProfile.runctx( command, globals(), locals(), filename="aestimo_numpy.profile" )
@@ -32,6 +32,14 @@ Fapplied = 0.00/50e-9 # (V/m)
 # For 1D, z-axis is choosen
 gridfactor = 0.1 #nm
 maxgridpoints = 200000 #for controlling the size
+# Non-uniform grid (optional):
+# mesh = 'auto' keeps gridfactor in wells, doped layers and next to interfaces
+# and lets the spacing grow by mesh_ratio per point, up to mesh_coarse (nm),
+# inside undoped barriers. A sixth value in a layer's row below sets that
+# layer's grid spacing (nm) explicitly.
+#mesh = 'auto'
+#mesh_coarse = 1.0 #nm
+#mesh_ratio = 1.05
 
 # REGIONS
 # Region input is a two-dimensional list input.
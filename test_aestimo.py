@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  Checks of the solver (python -m pytest).
+"""
+import copy
+import importlib
+import numpy as np
+import pytest
+
+import database
+import aestimo
+
+samples = ['sample-qw-qwdope','sample-qw-barrierdope','sample-moddop']
+
+def inputvalues(sample,**overrides):
+    """The values of a sample input file as a dict, with overrides"""
+    values = dict((name,value) for name,value in vars(importlib.import_module(sample)).items()
+                  if not name.startswith('_'))
+    values['material'] = copy.deepcopy(values['material'])
+    values.update(overrides)
+    return values
+
+def solve(values,**settings):
+    settings.setdefault('messagesoff',True)
+    return aestimo.Poisson_Schrodinger(aestimo.StructureFrom(values,database),aestimo.Settings(**settings))
+
+@pytest.mark.parametrize('sample',samples)
+def test_predictor_converges_fast(sample):
+    fixedpoint = solve(inputvalues(sample),poisson_update='fixedpoint',mixing='linear')
+    predictor = solve(inputvalues(sample),poisson_update='predictor',mixing='linear')
+    assert predictor.converged and predictor.iteration <= 10
+    assert predictor.iteration < fixedpoint.iteration
+    assert np.allclose(predictor.E_state,fixedpoint.E_state,atol=1e-4)
+    assert abs(predictor.E_F-fixedpoint.E_F) < 1e-4
+
+@pytest.mark.parametrize('kind',['undoped','p'])
+def test_predictor_without_electrons(kind):
+    values = inputvalues('sample-qw-qwdope')
+    for layer in values['material']:
+        layer[3] = 0.0 if kind == 'undoped' else 1e17
+        layer[4] = 'n' if kind == 'undoped' else 'p'
+    fixedpoint = solve(values,poisson_update='fixedpoint')
+    predictor = solve(values,poisson_update='predictor')
+    assert predictor.converged
+    assert np.all(np.isfinite(predictor.V))
+    assert np.allclose(predictor.E_state,fixedpoint.E_state,atol=1e-4)
+
+def test_calc_E_state_rejects_a_potential_that_is_not_finite():
+    model = aestimo.StructureFrom(inputvalues('sample-qw-qwdope'),database)
+    fi = model.fi.copy()
+    fi[len(fi)//2] = np.nan
+    with pytest.raises(ValueError):
+        aestimo.calc_E_state(2,fi,model,np.nanmin(fi),aestimo.Settings())
+
+@pytest.mark.parametrize('sample',samples)
+def test_sheet_charge_on_a_graded_mesh(sample):
+    values = inputvalues(sample,mesh='auto')
+    model = aestimo.StructureFrom(values,database)
+    layers = sum([model.dop[start]*np.sum(model.dxs[start:finish]) for start,finish in model.layer_ranges])
+    assert np.isclose(np.sum(model.dop*model.w),layers,rtol=1e-3) # up to the half points at the interfaces
+    result = solve(values)
+    assert result.converged
+    assert abs(np.sum(result.sigma)) < 1e-9*abs(layers) # the electrons balance the donors
+    assert np.isclose(np.sum(result.N_state),abs(np.sum(model.dop*model.w)),rtol=1e-6)
+
+@pytest.mark.parametrize('scheme',[0,2])
+def test_temperature_sweep_reports_the_last_temperature(scheme):
+    result = solve(inputvalues('sample-qw-qwdope',T=[10.0,100.0,300.0],computation_scheme=scheme))
+    assert result.T == 300.0
+    assert result.E_F == result.sweep_E_F[-1]
+    assert np.allclose(result.N_state,result.sweep_N_state[-1])
+
+def test_fermilevel_step_limit(caplog):
+    E_state,meff_state = [10.0,60.0],[0.067*aestimo.m_e]*2
+    Ef = aestimo.fermilevel(-1e16,[4.0,77.0,300.0],E_state,meff_state)
+    assert not caplog.records
+    assert np.allclose(aestimo.calc_N_state(Ef,[4.0,77.0,300.0],-1e16,E_state,meff_state).sum(axis=1),1e16,rtol=1e-6)
+    Ef = aestimo.fermilevel(-1e16,300.0,E_state,meff_state,max_steps=1)
+    assert np.isfinite(Ef)
+    assert 'has not converged' in caplog.text
+
+@pytest.mark.parametrize('bracketing',['scan','sturm'])
+def test_calc_E_state_index(bracketing):
+    model = aestimo.StructureFrom(inputvalues('sample-qw-qwdope'),database)
+    settings = aestimo.Settings(bracketing=bracketing)
+    E_all = aestimo.calc_E_state(3,model.fi,model,min(model.fi),settings)
+    for index in (0,1,2):
+        E = aestimo.calc_E_state(3-index,model.fi,model,min(model.fi),settings,index=index)
+        assert np.allclose(E,E_all[index:],atol=1e-3)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  Checks of the result cache (python -m pytest).
+"""
+import os
+import pytest
+
+import database
+import aestimo
+import aestimo_cache
+from test_aestimo import inputvalues
+
+@pytest.fixture
+def model():
+    return aestimo.StructureFrom(inputvalues('sample-qw-qwdope'),database)
+
+@pytest.fixture
+def cache(tmp_path):
+    return aestimo_cache.ResultCache(str(tmp_path/'cache'),size_limit=1e9)
+
+def test_key(cache,model):
+    settings = aestimo.Settings()
+    key = cache.key(model,settings)
+    # settings that don't change a converged result don't change the key
+    assert cache.key(model,aestimo.Settings(messagesoff=True,max_iterations=7)) == key
+    assert cache.key(model,aestimo.Settings(eigensolver='matrix')) != key
+    assert cache.key(aestimo.StructureFrom(inputvalues('sample-qw-qwdope',Fapplied=1e5),database),settings) != key
+
+def test_key_follows_the_solver_source(cache,model,monkeypatch):
+    key = cache.key(model,aestimo.Settings())
+    monkeypatch.setattr(aestimo_cache,'_solver_hash','another solver')
+    assert cache.key(model,aestimo.Settings()) != key
+
+def test_store_and_invalidate(cache,model):
+    settings = aestimo.Settings(messagesoff=True)
+    result = aestimo_cache.Poisson_Schrodinger(model,settings,cache=cache)
+    key = cache.key(model,settings)
+    stored = aestimo_cache.Poisson_Schrodinger(model,settings,cache=cache)
+    assert stored.cached and stored.E_state == result.E_state and stored.E_F == result.E_F
+    cache.invalidate(key)
+    assert cache.get(key) is None
+
+def test_unconverged_results_are_not_stored(cache,model):
+    settings = aestimo.Settings(messagesoff=True,max_iterations=1)
+    result = aestimo_cache.Poisson_Schrodinger(model,settings,cache=cache)
+    assert not result.converged
+    assert cache.get(cache.key(model,settings)) is None
+
+@pytest.mark.parametrize('damage',['truncated','garbled','empty'])
+def test_damaged_entry_is_a_miss(cache,model,damage):
+    settings = aestimo.Settings(messagesoff=True)
+    aestimo_cache.Poisson_Schrodinger(model,settings,cache=cache)
+    fname = cache.filename(cache.key(model,settings))
+    with open(fname,'rb') as fobj:
+        data = fobj.read()
+    data = {'truncated':data[:len(data)//2],'garbled':data[:100]+b'x'*50+data[150:],'empty':b''}[damage]
+    with open(fname,'wb') as fobj:
+        fobj.write(data)
+    assert cache.get(cache.key(model,settings)) is None
+    assert not getattr(aestimo_cache.Poisson_Schrodinger(model,settings,cache=cache),'cached',False)
+
+def test_off_by_default(model,tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    aestimo_cache.Poisson_Schrodinger(model,aestimo.Settings(messagesoff=True))
+    assert not os.path.exists(aestimo_cache.config.cache_directory)
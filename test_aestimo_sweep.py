@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ Aestimo EDU 1D Schrodinger-Poisson Solver
+ Copyright (C) 2013-2020  Aestimo group
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program. See ~/COPYING file or http://www.gnu.org/copyleft/gpl.txt .
+
+    For the list of contributors, see ~/AUTHORS
+
+ Description:  Checks of the parameter sweeps (python -m pytest).
+"""
+import multiprocessing
+import os
+import numpy as np
+import pytest
+
+import database
+import aestimo
+import aestimo_sweep
+from test_aestimo import inputvalues
+
+arrays = ('dxs','w','xaxis','cb_meff','fi','eps','dop')
+
+def assert_same_structure(model,expected):
+    assert model.n_max == expected.n_max
+    assert model.layer_ranges == expected.layer_ranges
+    for name in arrays:
+        assert np.allclose(getattr(model,name),getattr(expected,name),rtol=1e-12,atol=0.0),name
+    assert (model.T,model.Fapp,model.subnumber_e) == (expected.T,expected.Fapp,expected.subnumber_e)
+
+@pytest.mark.parametrize('mesh',['uniform','auto'])
+@pytest.mark.parametrize('names,point',[
+    (['layer1.doping'],(5e17,)),
+    (['layer0.alloy'],(0.3,)),
+    (['layer1.thickness'],(14.0,)),
+    (['layer2.type'],('p',)),
+    (['layer1.spacing'],(0.2,)),
+    (['layer0.doping','layer2.alloy','Fapplied'],(1e16,0.25,1e6)),
+])
+def test_update_layer_matches_a_rebuild(mesh,names,point):
+    values = inputvalues('sample-qw-qwdope',mesh=mesh)
+    base = aestimo.StructureFrom(values,database)
+    model = aestimo_sweep.build_model(values,database,names,point,base)
+    expected = aestimo.StructureFrom(aestimo_sweep.apply_point(values,database,names,point)[0],database)
+    assert_same_structure(model,expected)
+    assert_same_structure(base,aestimo.StructureFrom(values,database)) # the base is left unchanged
+
+def test_pool_crash(monkeypatch):
+    """A point that kills its worker is recorded as crashed, the others are solved"""
+    crash = 3e17
+    solve = aestimo_sweep.solve
+    def crashing_solve(point,guess=None):
+        if point[0] == crash:
+            os._exit(1)
+        return solve(point,guess)
+    pools = []
+    class Pool(aestimo_sweep.ProcessPoolExecutor):
+        def __init__(self,workers,**kwargs):
+            pools.append(workers)
+            super().__init__(workers,mp_context=multiprocessing.get_context('fork'),**kwargs)
+    monkeypatch.setattr(aestimo_sweep,'solve',crashing_solve)
+    monkeypatch.setattr(aestimo_sweep,'ProcessPoolExecutor',Pool)
+    dopings = [1e17,2e17,crash,4e17,5e17,6e17,7e17,8e17,9e17]
+    values = inputvalues('sample-qw-qwdope')
+    results = aestimo_sweep.sweep(values,{'layer1.doping':dopings},processes=2)
+    assert list(results.status) == ['crashed' if doping == crash else 'ok' for doping in dopings]
+    assert pools[0] == 2 and 2 in pools[1:] # the points after the crash go on in a fresh pool of 2